@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from metrics import metrics
+
+# Database writes its queries for MySQL (%s placeholders, INSERT IGNORE); a backend runs them on its engine
+
+
+class MySQLBackend:
+    def __init__(self, database='HSCSAPotd', pool_size=5):
+        import mysql.connector.pooling
+        self.pool_size = pool_size
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(pool_name='potd', pool_size=pool_size,
+                              user='root', password=os.getenv("database_password"),
+                              host=os.getenv("database_host", '127.0.0.1'),
+                              database=database)
+
+    @contextmanager
+    def cursor(self):
+        start = time.perf_counter()
+        conn = self.pool.get_connection()
+        try:
+            # pooled connections are only re-established when the server dropped them
+            if not conn.is_connected():
+                metrics.inc('database_reconnects_total')
+                conn.reconnect(attempts=3, delay=1)
+            metrics.observe('database_checkout_seconds', time.perf_counter() - start)
+            curr = conn.cursor()
+            try:
+                yield curr
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                curr.close()
+        finally:
+            conn.close()
+
+    def ensure_index(self, curr, table, name, columns):
+        query = f"""
+                    SELECT COUNT(*) FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+                """
+        curr.execute(query, (table, name))
+        if curr.fetchone()[0] == 0:
+            curr.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+    def close(self):
+        pass
+
+
+sqlite3.register_adapter(date, lambda x: x.isoformat())
+sqlite3.register_adapter(datetime, lambda x: x.isoformat(' '))
+sqlite3.register_converter('DATE', lambda x: date.fromisoformat(x.decode()))
+sqlite3.register_converter('DATETIME', lambda x: datetime.fromisoformat(x.decode()))
+
+
+class SQLiteCursor:
+    # rewrites MySQL-flavoured queries once and keeps the result, so sqlite's statement cache is hit every time
+    translations = {}
+
+    def __init__(self, curr):
+        self.curr = curr
+
+    @classmethod
+    def translate(cls, query):
+        if query not in cls.translations:
+            cls.translations[query] = query.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+        return cls.translations[query]
+
+    def execute(self, query, params=()):
+        return self.curr.execute(self.translate(query), params)
+
+    def executemany(self, query, params):
+        return self.curr.executemany(self.translate(query), params)
+
+    def __getattr__(self, name):
+        return getattr(self.curr, name)
+
+
+class SQLiteBackend:
+    # one connection in WAL mode, every transaction holds the lock so there is only ever one writer
+    def __init__(self, path='potd.db'):
+        self.pool_size = 1
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES,
+                                    cached_statements=512)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+
+    @contextmanager
+    def cursor(self):
+        start = time.perf_counter()
+        with self.lock:
+            metrics.observe('database_checkout_seconds', time.perf_counter() - start)
+            curr = SQLiteCursor(self.conn.cursor())
+            try:
+                yield curr
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                curr.close()
+
+    def ensure_index(self, curr, table, name, columns):
+        curr.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def from_env(database='HSCSAPotd', pool_size=5):
+    if os.getenv("database_backend", "mysql") == "sqlite":
+        return SQLiteBackend(os.getenv("database_path", "potd.db"))
+    return MySQLBackend(database, pool_size)
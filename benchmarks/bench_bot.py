@@ -0,0 +1,205 @@
+# Load test for the bot's hot paths against a fake Codeforces, fake Discord and a throwaway database.
+# Reports wall time, Codeforces API calls, database queries, Discord sends and peak traced memory of
+# update_problemset, update_solvers and the leaderboards for a growing number of registered handles.
+#
+#   python benchmarks/bench_bot.py                       # 10, 100, 1000 and 10000 handles
+#   python benchmarks/bench_bot.py --handles 100 --latency 0.05 --failure-rate 0.1
+#
+# With --backend mysql (the default) it needs the same MySQL server as the bot, a scratch schema is created and
+# dropped for every run. --backend sqlite uses a temporary database file instead.
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backends
+import cf_api
+import database
+import leaderboard
+import lookahead
+import solved_index
+import main
+import outbox
+import problem_index
+import snapshots
+import solvers
+from bench_problemset import FIXTURES, synthesize
+from fake_codeforces import FakeCodeforces
+from fake_discord import FakeBot, FakeContext
+from scheduler import potd_day
+
+GUILD = 1
+ANNOUNCE_CHANNEL = 10
+PROBLEMS_CHANNEL = 11
+
+
+class CountingCursor:
+    def __init__(self, curr, db):
+        self.curr = curr
+        self.db = db
+
+    def execute(self, *args, **kwargs):
+        self.db.queries += 1
+        return self.curr.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.db.queries += 1
+        return self.curr.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.curr, name)
+
+
+class CountingDatabase(database.Database):
+    queries = 0
+
+    @contextmanager
+    def cursor(self):
+        with super().cursor() as curr:
+            yield CountingCursor(curr, self)
+
+
+def scratch_schema(name, drop=False):
+    import mysql.connector
+    conn = mysql.connector.connect(user='root', password=os.getenv("database_password"), host='127.0.0.1')
+    curr = conn.cursor()
+    curr.execute(f"DROP DATABASE IF EXISTS {name}")
+    if not drop:
+        curr.execute(f"CREATE DATABASE {name}")
+    curr.close()
+    conn.close()
+
+
+def seed_handles(db, count):
+    with db.cursor() as curr:
+        curr.executemany("INSERT INTO handles (guild, discord_id, cf_handle, rating) VALUES (%s, %s, %s, %s)",
+                         [(GUILD, 1000 + i, f'user{i}', 1200) for i in range(count)])
+        curr.executemany("INSERT INTO user_stats (guild, discord_id) VALUES (%s, %s)",
+                         [(GUILD, 1000 + i) for i in range(count)])
+
+
+class Report:
+    def __init__(self, fake_cf, fake_bot, db):
+        self.fake_cf = fake_cf
+        self.fake_bot = fake_bot
+        self.db = db
+        self.rows = []
+
+    async def measure(self, name, coro):
+        calls, queries, sent = self.fake_cf.total_calls(), self.db.queries, self.fake_bot.sent()
+        tracemalloc.start()
+        start = time.perf_counter()
+        await coro
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.rows.append((name, elapsed, self.fake_cf.total_calls() - calls, self.db.queries - queries,
+                          self.fake_bot.sent() - sent, peak / 2 ** 20))
+
+
+async def run(count, args, fixtures):
+    schema = f'HSCSAPotd_bench_{os.getpid()}'
+    snapshot_dir = tempfile.mkdtemp(prefix='potd-bench-')
+    if args.backend == 'mysql':
+        scratch_schema(schema)
+        backend = None
+    else:
+        backend = backends.SQLiteBackend(os.path.join(snapshot_dir, 'bench.db'))
+    fake_cf = FakeCodeforces(fixtures, latency=args.latency, failure_rate=args.failure_rate)
+    fake_bot = FakeBot(latency=args.discord_latency)
+    try:
+        url = await fake_cf.start()
+        raw_db = await asyncio.to_thread(CountingDatabase, database=schema, backend=backend)
+        main.db = database.AsyncDatabase(raw_db)
+        main.cf = cf_api.CodeforcesAPI(limiter=cf_api.RateLimiter(rate=args.rate, burst=max(1, int(args.rate))),
+                                       base_url=url, backoff_base=0.01)
+        main.tracker = solvers.SolverTracker(main.cf, main.db)
+        main.problems = problem_index.ProblemIndex()
+        main.leaderboards = leaderboard.LeaderboardCache(main.db)
+        main.solved_history = solved_index.SolvedHistory(main.db, main.cf, solved_index.SolvedIndex())
+        main.potd_queue = lookahead.PotdQueue(main.db, main.problems, main.solved_history.index)
+        main.solve_writer = outbox.SolveWriter(main.db, main.solves_saved, window=0)
+        main.announcer = outbox.Announcer(fake_bot, window=0)
+        main.snapshot_store = snapshots.SnapshotStore(snapshot_dir)
+        main.bot.get_channel = fake_bot.get_channel
+        report = Report(fake_cf, fake_bot, raw_db)
+
+        for name in ['contests', 'problemset']:
+            writer = main.snapshot_store.writer(name)
+            writer.write(fake_cf.load(name))
+            writer.commit(name + '-fixture')
+        await report.measure('update_problemset (empty db)', main.update_problemset('problemset-fixture'))
+        await report.measure('update_problemset (up to date)', main.update_problemset('problemset-fixture'))
+
+        await main.db.set_guild_config(database.GuildConfig(GUILD, ANNOUNCE_CHANNEL, PROBLEMS_CHANNEL, None,
+                                                            [800, 1200, 900, 1300, 1000, 1600, 1400], 'UTC'))
+        await asyncio.to_thread(seed_handles, raw_db, count)
+        await report.measure('solve history sync', main.solved_history.sync())
+        await report.measure('fill_potd_queues', main.fill_potd_queues())
+        await report.measure('select_potd', main.select_potd(GUILD))
+        potd = await main.db.get_potd(GUILD, potd_day('UTC').date())
+        fake_cf.solved_problem = (potd.id, potd.rank)
+
+        handles = [f'user{i}' for i in range(count)]
+        for handle in handles[::10]:
+            fake_cf.solve(handle)
+        await report.measure('update_solvers (first tick, 10% solved)', main.update_solvers())
+        await report.measure('save solves', main.solve_writer.flush())
+        await report.measure('update_solvers (no new activity)', main.update_solvers())
+        for handle in handles[1::100]:
+            fake_cf.solve(handle)
+        await report.measure('update_solvers (1% new solvers)', main.update_solvers())
+        await report.measure('save solves', main.solve_writer.flush())
+        await asyncio.sleep(0.1)
+
+        ctx = FakeContext(GUILD, 1000, fake_bot.get_channel(12))
+        await report.measure('streak_leaderboard', main.streak_leaderboard.callback(ctx))
+        await report.measure('solves_leaderboard', main.solves_leaderboard.callback(ctx))
+        await report.measure('streak_leaderboard (cached, last page)', main.streak_leaderboard.callback(ctx, 10 ** 6))
+        await report.measure('rank', main.rank.callback(ctx))
+
+        print(f"\n{count} handles, {args.backend}")
+        print(f"{'':42} {'seconds':>9} {'api':>7} {'db':>7} {'sends':>7} {'peak MB':>9}")
+        for name, elapsed, calls, queries, sent, peak in report.rows:
+            print(f"{name:42} {elapsed:9.3f} {calls:7d} {queries:7d} {sent:7d} {peak:9.1f}")
+    finally:
+        await main.cf.close()
+        main.db.close()
+        await fake_cf.stop()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        if args.backend == 'mysql':
+            scratch_schema(schema, drop=True)
+
+
+async def bench(args):
+    fixtures = args.fixtures
+    if not os.path.exists(os.path.join(fixtures, 'problemset.json.gz')):
+        fixtures = tempfile.mkdtemp(prefix='potd-fixtures-')
+        synthesize(fixtures, 10000)
+    for count in args.handles:
+        await run(count, args, fixtures)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handles', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='mysql')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake Codeforces response')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake Codeforces responses that are 503')
+    parser.add_argument('--discord-latency', type=float, default=0.0, help='seconds added to every fake Discord call')
+    parser.add_argument('--rate', type=float, default=1000.0,
+                        help='requests per second allowed by the rate limiter, Codeforces itself allows 0.5')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(parse_args()))
@@ -0,0 +1,128 @@
+# Compares peak RSS and wall time of the old problemset sync (decode the whole payload, then diff)
+# against the streaming parser, on recorded contest.list / problemset.problems responses.
+#
+#   python benchmarks/bench_problemset.py --record      # download fixtures from Codeforces once
+#   python benchmarks/bench_problemset.py               # run both modes on the fixtures
+#   python benchmarks/bench_problemset.py --synthetic 50000   # or generate fake ones
+import argparse
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cf_api
+import problemset
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+URLS = {
+    'contests': "https://codeforces.com/api/contest.list",
+    'problemset': "https://codeforces.com/api/problemset.problems",
+}
+
+
+def record(directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, url in URLS.items():
+        with urllib.request.urlopen(url) as resp, gzip.open(os.path.join(directory, name + '.json.gz'), 'wb') as f:
+            f.write(resp.read())
+        print(f'Recorded {name}')
+
+
+def synthesize(directory, count):
+    os.makedirs(directory, exist_ok=True)
+    contests = [{'id': i, 'name': f'Codeforces Round {i}', 'phase': 'FINISHED'} for i in range(1, count // 5 + 2)]
+    problems = [{'contestId': i // 5 + 1, 'index': 'ABCDE'[i % 5], 'name': f'Problem {i}', 'type': 'PROGRAMMING',
+                 'rating': 800 + 100 * (i % 28), 'tags': ['dp', 'greedy']} for i in range(count)]
+    statistics = [{'contestId': i // 5 + 1, 'index': 'ABCDE'[i % 5], 'solvedCount': i} for i in range(count)]
+    with gzip.open(os.path.join(directory, 'contests.json.gz'), 'wt') as f:
+        json.dump({'status': 'OK', 'result': contests}, f)
+    with gzip.open(os.path.join(directory, 'problemset.json.gz'), 'wt') as f:
+        json.dump({'status': 'OK', 'result': {'problems': problems, 'problemStatistics': statistics}}, f)
+
+
+def chunks(path, chunk_size=1 << 16):
+    with gzip.open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def run_full(directory):
+    with gzip.open(os.path.join(directory, 'contests.json.gz'), 'rb') as f:
+        contest_list = json.loads(f.read())['result']
+    with gzip.open(os.path.join(directory, 'problemset.json.gz'), 'rb') as f:
+        problem_list = json.loads(f.read())['result']['problems']
+    mapping = {}
+    new_contests, new_problems = [], []
+    problem_names = set()
+    for contest in contest_list:
+        mapping[contest['id']] = contest['name']
+        if contest['phase'] == "FINISHED" and not problemset.isNonStandard(contest['name']):
+            new_contests.append((contest['id'], contest['name'].encode('ascii', 'replace').decode("ascii")))
+    for problem in problem_list:
+        problemName = problem['name'].encode('ascii', 'replace').decode("ascii")
+        if (problem['contestId'] in mapping and not problemset.isNonStandard(mapping[problem['contestId']])
+                and 'rating' in problem and problemName not in problem_names):
+            problem_names.add(problemName)
+            new_problems.append((problem['contestId'], problem['index'], problemName, problem['type'],
+                                 problem['rating'], False))
+    return new_contests, new_problems
+
+
+def run_stream(directory):
+    return problemset.diff_problemset(cf_api.iter_contests(chunks(os.path.join(directory, 'contests.json.gz'))),
+                                      cf_api.iter_problems(chunks(os.path.join(directory, 'problemset.json.gz'))),
+                                      set(), set(), set())
+
+
+def measure(mode, directory):
+    start = time.perf_counter()
+    new_contests, new_problems = (run_full if mode == 'full' else run_stream)(directory)[:2]
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on linux
+    print(json.dumps({'mode': mode, 'seconds': elapsed, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                      'contests': len(new_contests), 'problems': len(new_problems)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--record', action='store_true')
+    parser.add_argument('--synthetic', type=int)
+    parser.add_argument('--mode', choices=['full', 'stream'])
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.fixtures)
+        return
+    if args.synthetic:
+        synthesize(args.fixtures, args.synthetic)
+        return
+    if args.mode:
+        measure(args.mode, args.fixtures)
+        return
+    if not os.path.exists(os.path.join(args.fixtures, 'problemset.json.gz')):
+        sys.exit(f'No fixtures in {args.fixtures}, run with --record or --synthetic N first')
+
+    # each mode runs in its own process so the peak RSS of one doesn't hide the other
+    baseline = subprocess.run([sys.executable, '-c', 'import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'],
+                              capture_output=True, text=True)
+    print(f"interpreter baseline: {int(baseline.stdout) / 1024:.1f} MB")
+    for mode in ['full', 'stream']:
+        out = subprocess.run([sys.executable, __file__, '--fixtures', args.fixtures, '--mode', mode],
+                             capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:>6}: {result['seconds']:.3f}s, peak RSS {result['peak_rss_mb']:.1f} MB, "
+              f"{result['contests']} contests, {result['problems']} problems")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Gateway responsiveness while the sync jobs run, with them on the gateway's own loop and in worker.py.
+# The gateway side is main.py's event handling against a fake Discord, the worker is a real second process
+# and the fake Codeforces a third one, so neither adds to the gateway's loop. While the worker imports the
+# problemset, fills the POTD queues, posts the POTD and polls for solvers, the gateway measures its loop lag
+# and the latency of a .get_potd command.
+#
+#   python benchmarks/bench_worker.py                       # both modes, 1000 handles
+#   python benchmarks/bench_worker.py --mode worker --handles 10000
+#
+# Both processes share a SQLite database in a temporary directory.
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cf_api
+import database
+import events
+import leaderboard
+import main
+import outbox
+import snapshots
+import worker
+from bench_bot import ANNOUNCE_CHANNEL, GUILD, PROBLEMS_CHANNEL, seed_handles
+from bench_problemset import FIXTURES, synthesize
+from fake_codeforces import FakeCodeforces
+from fake_discord import FakeBot, FakeContext
+from scheduler import potd_day
+
+
+def fake_codeforces_process(fixtures, conn):
+    # answers with its url, then takes (problem, handles) messages to solve until it gets None
+    async def serve():
+        fake_cf = FakeCodeforces(fixtures)
+        conn.send(await fake_cf.start())
+        loop = asyncio.get_running_loop()
+        while (message := await loop.run_in_executor(None, conn.recv)) is not None:
+            fake_cf.solved_problem = message[0]
+            for handle in message[1]:
+                fake_cf.solve(handle)
+        await fake_cf.stop()
+    asyncio.run(serve())
+
+
+def codeforces(url):
+    return cf_api.CodeforcesAPI(limiter=cf_api.RateLimiter(rate=1000, burst=1000), base_url=url, backoff_base=0.01)
+
+
+def worker_process(url, snapshot_dir, socket_path):
+    main.snapshot_store = snapshots.SnapshotStore(snapshot_dir)
+    asyncio.run(worker.run(socket_path, codeforces(url)))
+
+
+def percentile(data, p):
+    if not data:
+        return 0
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p / 100))]
+
+
+class Probe:
+    # how late the gateway's loop wakes up, and how long a command takes, sampled in the background
+    def __init__(self, ctx, interval=0.005, command_interval=0.05):
+        self.ctx = ctx
+        self.interval = interval
+        self.command_interval = command_interval
+        self.lags = []
+        self.commands = []
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.lag()), asyncio.create_task(self.command())]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - start - self.interval)
+
+    async def command(self):
+        while True:
+            start = time.perf_counter()
+            await main.get_potd.callback(self.ctx)
+            self.commands.append(time.perf_counter() - start)
+            await asyncio.sleep(self.command_interval)
+
+
+async def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.05)
+
+
+async def run(mode, args, fixtures):
+    directory = tempfile.mkdtemp(prefix='potd-bench-')
+    os.environ['database_backend'] = 'sqlite'
+    os.environ['database_path'] = os.path.join(directory, 'bench.db')
+    socket_path = os.path.join(directory, 'worker.sock')
+    spawn = multiprocessing.get_context('spawn')
+    conn, child_conn = spawn.Pipe()
+    fake_cf = spawn.Process(target=fake_codeforces_process, args=(fixtures, child_conn), daemon=True)
+    fake_cf.start()
+    fake_bot = FakeBot(latency=args.discord_latency)
+    process = None
+    try:
+        url = conn.recv()
+        raw_db = await asyncio.to_thread(database.Database)
+        main.db = database.AsyncDatabase(raw_db)
+        main.leaderboards = leaderboard.LeaderboardCache(main.db)
+        main.announcer = outbox.Announcer(fake_bot, window=0)
+        main.bot.get_channel = fake_bot.get_channel
+        main.snapshot_store = snapshots.SnapshotStore(directory)
+        main.cf = main.gateway_link = main.worker_link = main.potd_scheduler = main.solve_writer = None
+        for name in ['contests', 'problemset']:
+            writer = main.snapshot_store.writer(name)
+            writer.write(FakeCodeforces(fixtures).load(name))
+            writer.commit(name + '-fixture')
+        await main.db.set_guild_config(database.GuildConfig(GUILD, ANNOUNCE_CHANNEL, PROBLEMS_CHANNEL, None,
+                                                            [800, 1200, 900, 1300, 1000, 1600, 1400], 'UTC'))
+        await asyncio.to_thread(seed_handles, raw_db, args.handles)
+
+        received = []
+
+        async def handle_event(event):
+            received.append(event)
+            await main.handle_event(event)
+
+        probe = Probe(FakeContext(GUILD, 1000, fake_bot.get_channel(12)))
+        cpu = resource.getrusage(resource.RUSAGE_SELF).ru_utime
+        start = time.perf_counter()
+        probe.start()
+        if mode == 'worker':
+            main.worker_link = events.EventLink(handle_event)
+            await main.worker_link.listen(socket_path)
+            process = spawn.Process(target=worker_process, args=(url, directory, socket_path), daemon=True)
+            process.start()
+        else:
+            main.cf = codeforces(url)
+            await main.start_sync()
+        await wait_for(lambda: fake_bot.get_channel(PROBLEMS_CHANNEL).messages, args.timeout)
+
+        potd = await main.db.get_potd(GUILD, potd_day('UTC').date())
+        conn.send(((potd.id, potd.rank), [f'user{i}' for i in range(0, args.handles, 10)]))
+        await main.command(events.PollRequested())
+        if main.solve_writer is not None:
+            await main.solve_writer.flush()
+        await wait_for(lambda: fake_bot.get_channel(ANNOUNCE_CHANNEL).messages, args.timeout)
+        elapsed = time.perf_counter() - start
+        probe.stop()
+        cpu = resource.getrusage(resource.RUSAGE_SELF).ru_utime - cpu
+
+        print(f"{mode:10} {elapsed:8.2f} {cpu:8.2f} "
+              f"{percentile(probe.lags, 50) * 1000:8.1f} {percentile(probe.lags, 99) * 1000:8.1f} {max(probe.lags) * 1000:8.1f} "
+              f"{percentile(probe.commands, 50) * 1000:8.1f} {percentile(probe.commands, 99) * 1000:8.1f} "
+              f"{max(probe.commands) * 1000:8.1f} {len(received):7d}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+        if main.potd_scheduler is not None:
+            main.potd_scheduler.scheduler.shutdown(wait=False)
+        if main.worker_link is not None:
+            await main.worker_link.close()
+        if main.cf is not None:
+            await main.cf.close()
+        main.db.close()
+        conn.send(None)
+        fake_cf.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def bench(args):
+    fixtures = args.fixtures
+    if not os.path.exists(os.path.join(fixtures, 'problemset.json.gz')):
+        fixtures = tempfile.mkdtemp(prefix='potd-fixtures-')
+        synthesize(fixtures, 10000)
+    print(f"{args.handles} handles")
+    print(f"{'mode':10} {'seconds':>8} {'cpu':>8} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} "
+          f"{'cmd p50':>8} {'cmd p99':>8} {'cmd max':>8} {'events':>7}")
+    for mode in ['inprocess', 'worker'] if args.mode == 'both' else [args.mode]:
+        await run(mode, args, fixtures)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handles', type=int, default=1000)
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--mode', choices=['inprocess', 'worker', 'both'], default='both')
+    parser.add_argument('--discord-latency', type=float, default=0.0, help='seconds added to every fake Discord call')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for the POTD and the solves')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(parse_args()))
@@ -0,0 +1,109 @@
+# A local stand-in for the Codeforces API. It serves user.status, user.info, problemset.recentStatus,
+# contest.list and problemset.problems from recorded responses (or generated ones), with configurable latency
+# and a configurable fraction of 503 "limit exceeded" responses.
+import asyncio
+import gzip
+import os
+import random
+import time
+
+from aiohttp import web
+
+
+class FakeCodeforces:
+    def __init__(self, fixtures=None, latency=0.0, failure_rate=0.0, submissions_per_user=50, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.submissions_per_user = submissions_per_user
+        self.random = random.Random(seed)
+        self.calls = {}
+        # arrival time of every request and the number answered with 503
+        self.times = []
+        self.failures = 0
+        self.solvers = set()
+        self.solved_problem = None
+        self.next_submission = 1
+        self.submissions = {}
+        self.feed = []
+        self.runner = None
+        self.url = None
+
+    def load(self, name):
+        if self.fixtures is None:
+            return None
+        path = os.path.join(self.fixtures, name + '.json.gz')
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+
+    def submission(self, handle, contest_id, index, verdict):
+        self.next_submission += 1
+        submission = {'id': self.next_submission, 'contestId': contest_id, 'creationTimeSeconds': 1700000000 + self.next_submission,
+                'problem': {'contestId': contest_id, 'index': index, 'name': f'Problem {contest_id}{index}',
+                            'type': 'PROGRAMMING', 'rating': 800 + 100 * (contest_id % 20), 'tags': []},
+                'author': {'members': [{'handle': handle}]}, 'verdict': verdict}
+        self.feed.append(submission)
+        return submission
+
+    def history(self, handle):
+        if handle not in self.submissions:
+            self.submissions[handle] = [self.submission(handle, self.random.randint(1, 1800), 'ABCDE'[self.random.randint(0, 4)],
+                                                        self.random.choice(['OK', 'WRONG_ANSWER']))
+                                        for _ in range(self.submissions_per_user)][::-1]
+        return self.submissions[handle]
+
+    def noise(self, count):
+        # submissions by people outside the bot, they only show up in problemset.recentStatus
+        for _ in range(count):
+            self.submission(f'stranger{self.random.randint(1, 10 ** 6)}', self.random.randint(1, 1800), 'A', 'WRONG_ANSWER')
+
+    def solve(self, handle):
+        # adds an accepted submission for the current solved_problem at the top of the handle's history
+        self.history(handle).insert(0, self.submission(handle, self.solved_problem[0], self.solved_problem[1], 'OK'))
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.times.append(time.monotonic())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=503)
+        if method in ['contest.list', 'problemset.problems']:
+            body = self.load('contests' if method == 'contest.list' else 'problemset')
+            if body is None:
+                return web.json_response({'status': 'FAILED', 'comment': f'no fixture for {method}'}, status=400)
+            return web.Response(body=body, content_type='application/json')
+        if method == 'user.info':
+            handles = request.query['handles'].split(';')
+            return web.json_response({'status': 'OK', 'result': [
+                {'handle': x, 'rating': 1200 + len(x), 'rank': 'pupil', 'firstName': 'Fake', 'titlePhoto': ''} for x in handles]})
+        if method == 'problemset.recentStatus':
+            count = int(request.query.get('count', 1000))
+            return web.json_response({'status': 'OK', 'result': self.feed[:-count - 1:-1]})
+        if method == 'user.status':
+            history = self.history(request.query['handle'])
+            start = int(request.query.get('from', 1)) - 1
+            count = int(request.query.get('count', len(history)))
+            return web.json_response({'status': 'OK', 'result': history[start:start + count]})
+        return web.json_response({'status': 'FAILED', 'comment': f'unknown method {method}'}, status=400)
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/api/{method}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{port}/api'
+        return self.url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def total_calls(self):
+        return sum(self.calls.values())
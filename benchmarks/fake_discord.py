@@ -0,0 +1,70 @@
+# Minimal stand-ins for the discord.py objects main.py touches, recording what would have been sent.
+import asyncio
+from collections import namedtuple
+
+FakeGuild = namedtuple('FakeGuild', 'id')
+FakeRole = namedtuple('FakeRole', 'name')
+
+
+class FakeMessage:
+    def __init__(self, channel, content, embed):
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.reactions = []
+
+    async def publish(self):
+        await asyncio.sleep(self.channel.latency)
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(self.channel.latency)
+        self.reactions.append(emoji)
+
+
+class FakeChannel:
+    def __init__(self, id, latency=0.0):
+        self.id = id
+        self.latency = latency
+        self.messages = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self, content, embed)
+        self.messages.append(message)
+        return message
+
+
+class FakePermissions:
+    manage_guild = True
+
+
+class FakeAuthor:
+    def __init__(self, id):
+        self.id = id
+        self.mention = f'<@{id}>'
+        self.roles = [FakeRole('POTD Manager')]
+
+
+class FakeContext:
+    def __init__(self, guild, author, channel):
+        self.guild = FakeGuild(guild)
+        self.author = FakeAuthor(author)
+        self.channel = channel
+        self.channel.permissions_for = lambda member: FakePermissions()
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return await self.channel.send(content, embed=embed, **kwargs)
+
+
+class FakeBot:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.channels = {}
+
+    def get_channel(self, id):
+        if id not in self.channels:
+            self.channels[id] = FakeChannel(id, self.latency)
+        return self.channels[id]
+
+    def sent(self):
+        return sum(len(x.messages) for x in self.channels.values())
@@ -1,65 +1,238 @@
 import aiohttp
 import asyncio
+import hashlib
+import json
+import random
+import re
+import time
 
-from collections import namedtuple
+from collections import OrderedDict, deque, namedtuple
+
+from json_stream import ArrayStreamParser, iter_array
+from metrics import metrics
+
+ContestRecord = namedtuple('ContestRecord', 'id name phase')
+ProblemRecord = namedtuple('ProblemRecord', 'contest_id index name type rating tags')
+
+
+class Submission:
+    # one user.status entry; a tick converts thousands of these, so no per-instance __dict__
+    __slots__ = ('id', 'index', 'name', 'type', 'rating', 'sub_time', 'verdict', 'sub_id')
+
+    def __init__(self, id, index, name, type, rating, sub_time, verdict, sub_id):
+        self.id = id
+        self.index = index
+        self.name = name
+        self.type = type
+        self.rating = rating
+        self.sub_time = sub_time
+        self.verdict = verdict
+        self.sub_id = sub_id
+
+
+class RateLimiter:
+    # token bucket shared by every CodeforcesAPI in the process; CF allows about 1 request per 2 seconds
+    def __init__(self, rate=0.5, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+            self.tokens = 0
+            self.updated = time.monotonic()
+            return wait
+
+
+class APIStats:
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0
+        data = sorted(self.latencies)
+        return data[min(len(data) - 1, int(len(data) * p / 100))]
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class UserInfoCache:
+    # user.info results keyed by lower-case handle, evicted by age and least recent use
+    def __init__(self, ttl=600, max_size=2000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, handle):
+        key = handle.lower()
+        if key not in self.entries:
+            return None
+        expires, info = self.entries[key]
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return info
+
+    def put(self, handle, info):
+        key = handle.lower()
+        self.entries[key] = (time.monotonic() + self.ttl, info)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+limiter = RateLimiter()
+
+
+def api_method(url):
+    return url.split('?', 1)[0].rsplit('/', 1)[-1]
 
 
 class CodeforcesAPI:
-    def __init__(self):
-        pass
+    def __init__(self, limiter=limiter, max_tries=5, backoff_base=1, backoff_cap=16, connection_limit=10,
+                 batch_window=0.05, batch_size=300, base_url="https://codeforces.com/api"):
+        self.base_url = base_url
+        self.limiter = limiter
+        self.max_tries = max_tries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.connection_limit = connection_limit
+        self.session = None
+        self.stats = APIStats()
+        self.user_cache = UserInfoCache()
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.pending_users = {}
+        self.flush_task = None
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def backoff(self, tries, method):
+        self.stats.retries += 1
+        metrics.inc('codeforces_retries_total', method=method)
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (tries - 1))
+        await asyncio.sleep(random.uniform(0, delay))
 
     async def api_response(self, url, params=None):
         try:
-            tries = 0
-            async with aiohttp.ClientSession() as session:
-                while tries < 5:
-                    tries += 1
+            session = self.get_session()
+            method = api_method(url)
+            response = None
+            for tries in range(1, self.max_tries + 1):
+                wait = await self.limiter.acquire()
+                metrics.observe('codeforces_throttle_seconds', wait)
+                if wait:
+                    self.stats.throttled += 1
+                self.stats.requests += 1
+                start = time.perf_counter()
+                try:
                     async with session.get(url, params=params) as resp:
-                        response = {}
                         if resp.status == 503:
-                            response['status'] = "FAILED"
-                            response['comment'] = "limit exceeded"
+                            response = {'status': "FAILED", 'comment': "limit exceeded"}
                         else:
-                            response = await resp.json()
+                            response = json.loads(await resp.read())
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    self.stats.errors += 1
+                    metrics.inc('codeforces_errors_total', method=method)
+                    response = None
+                    if tries < self.max_tries:
+                        await self.backoff(tries, method)
+                    continue
+                finally:
+                    self.stats.latencies.append(time.perf_counter() - start)
+                    metrics.observe('codeforces_request_seconds', time.perf_counter() - start, method=method)
 
-                        if response['status'] == 'FAILED' and 'limit exceeded' in response['comment'].lower():
-                            await asyncio.sleep(1)
-                        else:
-                            return response
-                return response
-        except Exception as e:
+                if response['status'] == 'FAILED' and 'limit exceeded' in response['comment'].lower():
+                    if tries < self.max_tries:
+                        await self.backoff(tries, method)
+                else:
+                    return response
+            return response
+        except Exception:
             return None
 
     async def check_handle(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if not response:
-            return [False, "Codeforces API Error"]
-        if response["status"] != "OK":
-            return [False, response["comment"]]
-        else:
-            return [True, response["result"][0]]
-
-    async def get_contest_list(self):
-        url = "https://codeforces.com/api/contest.list"
-        response = await self.api_response(url)
-        if not response:
-            return False
-        else:
-            return response['result']
+        return await self.get_user(handle)
 
-    async def get_problem_list(self):
-        url = "https://codeforces.com/api/problemset.problems"
-        response = await self.api_response(url)
-        if not response:
-            return False
-        else:
-            return response['result']['problems']
+    async def download(self, url, sink, chunk_size=1 << 16):
+        # streams a response body into sink without holding it in memory, returns its sha256 or None
+        session = self.get_session()
+        method = api_method(url)
+        for tries in range(1, self.max_tries + 1):
+            wait = await self.limiter.acquire()
+            metrics.observe('codeforces_throttle_seconds', wait)
+            if wait:
+                self.stats.throttled += 1
+            self.stats.requests += 1
+            start = time.perf_counter()
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=300)) as resp:
+                    if resp.status == 503:
+                        if tries < self.max_tries:
+                            await self.backoff(tries, method)
+                        continue
+                    if resp.status != 200:
+                        return None
+                    digest = hashlib.sha256()
+                    async for chunk in resp.content.iter_chunked(chunk_size):
+                        digest.update(chunk)
+                        sink(chunk)
+                    return digest.hexdigest()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.stats.errors += 1
+                metrics.inc('codeforces_errors_total', method=method)
+                return None
+            finally:
+                self.stats.latencies.append(time.perf_counter() - start)
+                metrics.observe('codeforces_request_seconds', time.perf_counter() - start, method=method)
+        return None
+
+    async def download_contest_list(self, sink):
+        return await self.download(f"{self.base_url}/contest.list", sink)
+
+    async def download_problem_list(self, sink):
+        return await self.download(f"{self.base_url}/problemset.problems", sink)
 
-    async def get_user_problems(self, handle, count=None):
-        url = f"https://codeforces.com/api/user.status?handle={handle}"
+    async def get_user_problems(self, handle, count=None, start=1):
+        url = f"{self.base_url}/user.status?handle={handle}"
         if count:
-            url += f"&from=1&count={count}"
+            url += f"&from={start}&count={count}"
         response = await self.api_response(url)
         if not response:
             return [False, "CF API Error"]
@@ -67,37 +240,132 @@ class CodeforcesAPI:
             return [False, response['comment']]
         try:
             data = []
-            Problem = namedtuple('Problem', 'id index name type rating, sub_time, verdict')
+            # unrated problems are kept, a fresh contest's problems have no rating yet but can be the POTD
             for x in response['result']:
                 y = x['problem']
-                if 'rating' not in y:
-                    continue
-                if 'verdict' not in x:
-                    x['verdict'] = None
-                data.append(Problem(y['contestId'], y['index'], y['name'], y['type'], y['rating'],
-                                    x['creationTimeSeconds'], x['verdict']))
+                data.append(Submission(y.get('contestId'), y['index'], y['name'], y['type'], y.get('rating'),
+                                       x['creationTimeSeconds'], x.get('verdict'), x['id']))
+            return [True, data]
+        except Exception as e:
+            return [False, str(e)]
+
+    async def get_solved_problems(self, handle):
+        # a handle's whole history, parsed as it downloads and reduced to the (contestId, index) pairs it got accepted on
+        solved = set()
+        parser = ArrayStreamParser('result')
+
+        def sink(chunk):
+            for x in parser.feed(chunk):
+                if x.get('verdict') == 'OK' and 'contestId' in x['problem']:
+                    solved.add((x['problem']['contestId'], x['problem']['index']))
+
+        if await self.download(f"{self.base_url}/user.status?handle={handle}", sink) is None:
+            return None
+        return solved
+
+    async def get_recent_status(self, count=1000):
+        # the newest submissions on the whole site, newest first, each with the handles of its authors
+        response = await self.api_response(f"{self.base_url}/problemset.recentStatus?count={count}")
+        if not response:
+            return [False, "CF API Error"]
+        if response['status'] != 'OK':
+            return [False, response['comment']]
+        try:
+            data = []
+            for x in response['result']:
+                y = x['problem']
+                data.append((Submission(y.get('contestId'), y['index'], y['name'], y['type'], y.get('rating'),
+                                        x['creationTimeSeconds'], x.get('verdict'), x['id']),
+                             [member['handle'] for member in x['author']['members']]))
             return [True, data]
         except Exception as e:
             return [False, str(e)]
 
     async def get_rating(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if response is None:
+        data = await self.get_user(handle)
+        if not data[0]:
             return None
-        if 'rating' in response["result"][0]:
-            return response["result"][0]["rating"]
-        else:
-            return 0
+        return data[1].get("rating", 0)
 
     async def get_first_name(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if not response or "firstName" not in response["result"][0]:
+        # always asked right after the user edits their profile, so never served from the cache
+        data = await self.get_user(handle, fresh=True)
+        if not data[0]:
             return None
-        return response["result"][0]["firstName"]
+        return data[1].get("firstName")
+
+    async def get_user_info(self, handles, fresh=False):
+        data = await asyncio.gather(*[self.get_user(handle, fresh) for handle in handles])
+        return [x[1] if x[0] else None for x in data]
+
+    async def get_user(self, handle, fresh=False):
+        if not fresh:
+            info = self.user_cache.get(handle)
+            if info is not None:
+                return [True, info]
+        key = handle.lower()
+        if key not in self.pending_users:
+            self.pending_users[key] = (handle, asyncio.get_running_loop().create_future())
+            if self.flush_task is None:
+                self.flush_task = asyncio.create_task(self.flush_users())
+        return await asyncio.shield(self.pending_users[key][1])
+
+    async def flush_users(self):
+        # lookups arriving within batch_window share one user.info?handles=a;b;c request
+        await asyncio.sleep(self.batch_window)
+        pending, self.pending_users, self.flush_task = self.pending_users, {}, None
+        batch = list(pending.values())
+        for i in range(0, len(batch), self.batch_size):
+            chunk = batch[i:i + self.batch_size]
+            try:
+                await self.fetch_users(chunk)
+            except Exception as e:
+                for _, future in chunk:
+                    if not future.done():
+                        future.set_result([False, str(e)])
+
+    async def fetch_users(self, batch):
+        while batch:
+            url = f"{self.base_url}/user.info?handles=" + ";".join(handle for handle, _ in batch)
+            response = await self.api_response(url)
+            if not response:
+                results = [[False, "Codeforces API Error"]] * len(batch)
+            elif response["status"] != "OK":
+                # one unknown handle fails the whole request, answer it and retry the rest
+                missing = re.search(r"User with handle (\S+) not found", response["comment"])
+                if missing is None:
+                    results = [[False, response["comment"]]] * len(batch)
+                else:
+                    rest = []
+                    for handle, future in batch:
+                        if handle.lower() == missing.group(1).lower():
+                            if not future.done():
+                                future.set_result([False, response["comment"]])
+                        else:
+                            rest.append((handle, future))
+                    if len(rest) == len(batch):
+                        results = [[False, response["comment"]]] * len(batch)
+                    else:
+                        batch = rest
+                        continue
+            else:
+                results = []
+                for (handle, _), info in zip(batch, response["result"]):
+                    self.user_cache.put(handle, info)
+                    self.user_cache.put(info["handle"], info)
+                    results.append([True, info])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            return
+
+
+def iter_contests(chunks):
+    for x in iter_array(chunks, 'result'):
+        yield ContestRecord(x['id'], x['name'], x['phase'])
+
 
-    async def get_user_info(self, handles):
-        url = f"https://codeforces.com/api/user.info"
-        response = await self.api_response(url, handles)
-        return response['result']
+def iter_problems(chunks):
+    for x in iter_array(chunks, 'problems'):
+        yield ProblemRecord(x.get('contestId'), x['index'], x['name'], x['type'], x.get('rating'),
+                            x.get('tags', []))
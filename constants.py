@@ -1,3 +1,6 @@
 POTD_ANNOUNCE=1120524341474508840
 POTD_PROBLEMS=1120895209144852552
-POTD_GUILD=898053300560220200
\ No newline at end of file
+POTD_GUILD=898053300560220200
+POTD_ROLE=1120846668833771560
+POTD_TIMEZONE='Etc/GMT+7'
+POTD_DIFFICULTIES=[800, 1200, 900, 1300, 1000, 1600, 1400]
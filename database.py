@@ -1,19 +1,31 @@
-import mysql.connector
-import os
+import asyncio
+import functools
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 from collections import namedtuple
 from dotenv import load_dotenv
 
+import backends
+from metrics import metrics
+from constants import POTD_ANNOUNCE, POTD_DIFFICULTIES, POTD_GUILD, POTD_PROBLEMS, POTD_ROLE, POTD_TIMEZONE
+
 load_dotenv();
 
+GuildConfig = namedtuple('GuildConfig', 'guild announce_channel problems_channel role difficulties timezone admin_channel theme',
+                         defaults=[None, None])
+
 class Database:
-    def __init__(self):
-        self.conn = mysql.connector.connect(user='root', password=os.getenv("database_password"),
-                              host='127.0.0.1',
-                              database='HSCSAPotd')
+    def __init__(self, pool_size=5, database='HSCSAPotd', backend=None):
+        # MySQL unless database_backend=sqlite is set, see backends.py
+        self.backend = backend or backends.from_env(database, pool_size)
+        self.pool_size = self.backend.pool_size
         self.make_tables()
+
+    def cursor(self):
+        return self.backend.cursor()
+
     def make_tables(self):
         cmds = []
         cmds.append("""
@@ -21,7 +33,9 @@ class Database:
                            guild BIGINT,
                            discord_id BIGINT,
                            cf_handle TEXT,
-                           rating INT
+                           rating INT,
+                           cf_rank VARCHAR(32),
+                           title_photo TEXT
                     )
                     """)
         cmds.append("""
@@ -35,6 +49,14 @@ class Database:
                             used BOOLEAN
                     )
                     """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS problem_tags(
+                            id INT,
+                            rank VARCHAR(8),
+                            tag VARCHAR(64),
+                            PRIMARY KEY (id, rank, tag)
+                    )
+                    """)
         cmds.append("""
                         CREATE TABLE IF NOT EXISTS contests(
                             id INT, 
@@ -49,15 +71,200 @@ class Database:
                             use_date DATE
                     )
                     """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS potd_solves(
+                            guild BIGINT,
+                            discord_id BIGINT,
+                            potd_date DATE,
+                            solved_at DATETIME,
+                            PRIMARY KEY (guild, discord_id, potd_date)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS user_stats(
+                            guild BIGINT,
+                            discord_id BIGINT,
+                            current_streak INT DEFAULT 0,
+                            longest_streak INT DEFAULT 0,
+                            total_solves INT DEFAULT 0,
+                            last_solved_date DATE,
+                            PRIMARY KEY (guild, discord_id)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS guild_config(
+                            guild BIGINT PRIMARY KEY,
+                            announce_channel BIGINT,
+                            problems_channel BIGINT,
+                            role BIGINT,
+                            difficulties VARCHAR(255),
+                            timezone VARCHAR(64),
+                            admin_channel BIGINT,
+                            theme VARCHAR(255)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS handle_challenges(
+                            guild BIGINT,
+                            discord_id BIGINT,
+                            cf_handle VARCHAR(64),
+                            token VARCHAR(32),
+                            channel BIGINT,
+                            expires_at DATETIME,
+                            PRIMARY KEY (guild, discord_id)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS potd_queue(
+                            guild BIGINT,
+                            use_date DATE,
+                            id INT,
+                            rank VARCHAR(8),
+                            name TEXT,
+                            PRIMARY KEY (guild, use_date)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS solved_problems(
+                            cf_handle VARCHAR(64),
+                            id INT,
+                            rank VARCHAR(8),
+                            PRIMARY KEY (cf_handle, id, rank)
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS solved_history(
+                            cf_handle VARCHAR(64) PRIMARY KEY,
+                            synced_at DATETIME
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS submission_cursors(
+                            cf_handle VARCHAR(64) PRIMARY KEY,
+                            last_submission BIGINT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS sync_state(
+                            name VARCHAR(64) PRIMARY KEY,
+                            value TEXT
+                    )
+                    """)
         try:
-            self.conn.reconnect()
-            curr = self.conn.cursor()
-            for x in cmds:
-                curr.execute(x)
-            curr.close()
-            self.conn.commit()
+            with self.cursor() as curr:
+                for x in cmds:
+                    curr.execute(x)
+                self.ensure_index(curr, 'problems', 'problems_rating_used', 'rating, used')
+                self.ensure_index(curr, 'problem_tags', 'problem_tags_tag', 'tag')
+                self.ensure_index(curr, 'potd_solves', 'potd_solves_date', 'guild, potd_date')
+                self.ensure_index(curr, 'user_stats', 'user_stats_streak', 'guild, current_streak')
+                self.ensure_index(curr, 'user_stats', 'user_stats_solves', 'guild, total_solves')
         except Exception:
             print("Error while making tables")
+        self.migrate_solved_columns()
+        self.migrate_single_guild()
+        self.migrate_admin_channel()
+        self.migrate_handle_profile()
+        self.migrate_guild_theme()
+        if self.count_user_stats() == 0:
+            self.rebuild_user_stats()
+
+    def ensure_index(self, curr, table, name, columns):
+        self.backend.ensure_index(curr, table, name, columns)
+
+    def migrate_solved_columns(self):
+        # handles used to get a solved_YYYY-MM-DD column per day, move them into potd_solves
+        with self.cursor() as curr:
+            curr.execute("SELECT * FROM handles LIMIT 0")
+            columns = [x[0] for x in curr.description if x[0].startswith('solved_')]
+            curr.fetchall()
+            if not columns:
+                return
+            query = """
+                        INSERT IGNORE INTO potd_solves
+                        (guild, discord_id, potd_date, solved_at)
+                        SELECT guild, discord_id, %%s, NULL FROM handles
+                        WHERE %s = true
+                    """
+            for column in columns:
+                curr.execute(query % ('`' + column + '`',), (column[len('solved_'):],))
+            curr.execute("ALTER TABLE handles " + ", ".join('DROP COLUMN `' + x + '`' for x in columns))
+        print(f"Migrated {len(columns)} solved columns to potd_solves")
+
+    def migrate_single_guild(self):
+        # potds and the channels used to be global, attach them to the guild from constants.py
+        with self.cursor() as curr:
+            curr.execute("SELECT * FROM potds LIMIT 0")
+            columns = [x[0] for x in curr.description]
+            curr.fetchall()
+            if 'guild' not in columns:
+                curr.execute("ALTER TABLE potds ADD guild BIGINT")
+                curr.execute("UPDATE potds SET guild = %s", (POTD_GUILD,))
+                print("Attached existing POTDs to the default guild")
+            self.ensure_index(curr, 'potds', 'potds_guild_date', 'guild, use_date')
+            curr.execute("SELECT COUNT(*) FROM guild_config")
+            if curr.fetchone()[0] == 0:
+                curr.execute("""
+                                INSERT INTO guild_config
+                                (guild, announce_channel, problems_channel, role, difficulties, timezone)
+                                VALUES
+                                (%s, %s, %s, %s, %s, %s)
+                            """, (POTD_GUILD, POTD_ANNOUNCE, POTD_PROBLEMS, POTD_ROLE,
+                                   ','.join(str(x) for x in POTD_DIFFICULTIES), POTD_TIMEZONE))
+
+    def migrate_admin_channel(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT * FROM guild_config LIMIT 0")
+            columns = [x[0] for x in curr.description]
+            curr.fetchall()
+            if 'admin_channel' not in columns:
+                curr.execute("ALTER TABLE guild_config ADD admin_channel BIGINT")
+
+    def migrate_handle_profile(self):
+        # rank and avatar are kept next to the rating so get_handle doesn't need Codeforces
+        with self.cursor() as curr:
+            curr.execute("SELECT * FROM handles LIMIT 0")
+            columns = [x[0] for x in curr.description]
+            curr.fetchall()
+            if 'cf_rank' not in columns:
+                curr.execute("ALTER TABLE handles ADD cf_rank VARCHAR(32)")
+            if 'title_photo' not in columns:
+                curr.execute("ALTER TABLE handles ADD title_photo TEXT")
+
+    def migrate_guild_theme(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT * FROM guild_config LIMIT 0")
+            columns = [x[0] for x in curr.description]
+            curr.fetchall()
+            if 'theme' not in columns:
+                curr.execute("ALTER TABLE guild_config ADD theme VARCHAR(255)")
+
+    def get_guild_configs(self):
+        query = f"""
+                    SELECT guild, announce_channel, problems_channel, role, difficulties, timezone, admin_channel, theme FROM guild_config
+                """
+        with self.cursor() as curr:
+            curr.execute(query)
+            data = curr.fetchall()
+        return [GuildConfig(x[0], x[1], x[2], x[3], [int(y) for y in x[4].split(',')], x[5], x[6], x[7]) for x in data]
+
+    def get_guild_config(self, guild):
+        for config in self.get_guild_configs():
+            if config.guild == guild:
+                return config
+        return None
+
+    def set_guild_config(self, config):
+        query = f"""
+                    REPLACE INTO guild_config
+                    (guild, announce_channel, problems_channel, role, difficulties, timezone, admin_channel, theme)
+                    VALUES
+                    (%s, %s, %s, %s, %s, %s, %s, %s)
+                """
+        with self.cursor() as curr:
+            curr.execute(query, (config.guild, config.announce_channel, config.problems_channel, config.role,
+                                 ','.join(str(x) for x in config.difficulties), config.timezone, config.admin_channel,
+                                 config.theme))
 
     def get_handle(self, guild, discord_id):
         query = f"""
@@ -66,41 +273,65 @@ class Database:
                     guild = %s AND
                     discord_id = %s
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (guild, discord_id))
-        data = curr.fetchone()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query, (guild, discord_id))
+            data = curr.fetchone()
         if not data:
             return None
         return data[0]
 
-    def add_handle(self, guild, discord_id, cf_handle, rating):
+    def get_handle_info(self, guild, discord_id):
+        query = f"""
+                    SELECT cf_handle, rating, cf_rank, title_photo FROM handles
+                    WHERE
+                    guild = %s AND
+                    discord_id = %s
+                """
+        with self.cursor() as curr:
+            curr.execute(query, (guild, discord_id))
+            data = curr.fetchone()
+        return data
+
+    def add_handle(self, guild, discord_id, cf_handle, rating, cf_rank=None, title_photo=None):
         query = f"""
                     INSERT INTO handles
-                    (guild, discord_id, cf_handle, rating)
+                    (guild, discord_id, cf_handle, rating, cf_rank, title_photo)
                     VALUES
-                    (%s, %s, %s, %s)
+                    (%s, %s, %s, %s, %s, %s)
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (guild, discord_id, cf_handle, rating))
-        self.conn.commit()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query, (guild, discord_id, cf_handle, rating, cf_rank, title_photo))
+            curr.execute("INSERT IGNORE INTO user_stats (guild, discord_id) VALUES (%s, %s)", (guild, discord_id))
 
     def get_all_handles(self, guild=None):
         query = f"""
-                    SELECT * FROM handles
+                    SELECT guild, discord_id, cf_handle, rating FROM handles
                 """
         if guild is not None:
             query += f" WHERE guild = {guild}"
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query)
-        data = curr.fetchall()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query)
+            data = curr.fetchall()
         return data
 
+    def get_handle_profiles(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT DISTINCT cf_handle, rating, cf_rank, title_photo FROM handles")
+            data = curr.fetchall()
+        return data
+
+    def update_handle_profiles(self, rows):
+        # rows of (rating, cf_rank, title_photo, cf_handle)
+        with self.cursor() as curr:
+            curr.executemany("UPDATE handles SET rating = %s, cf_rank = %s, title_photo = %s WHERE cf_handle = %s", rows)
+
+    def rename_handle(self, old, new):
+        with self.cursor() as curr:
+            curr.execute("UPDATE handles SET cf_handle = %s WHERE cf_handle = %s", (new, old))
+            curr.execute("UPDATE solved_problems SET cf_handle = %s WHERE cf_handle = %s", (new, old))
+            curr.execute("UPDATE solved_history SET cf_handle = %s WHERE cf_handle = %s", (new, old))
+            curr.execute("DELETE FROM submission_cursors WHERE cf_handle = %s", (old,))
+
     def remove_handle(self, guild, discord_id):
         query = f"""
                     DELETE from handles
@@ -108,31 +339,48 @@ class Database:
                     guild = %s AND
                     discord_id = %s
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (guild, discord_id))
-        self.conn.commit()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query, (guild, discord_id))
+            curr.execute("DELETE FROM potd_solves WHERE guild = %s AND discord_id = %s", (guild, discord_id))
+            curr.execute("DELETE FROM user_stats WHERE guild = %s AND discord_id = %s", (guild, discord_id))
+
+    def add_challenge(self, guild, discord_id, cf_handle, token, channel, expires_at):
+        query = f"""
+                    REPLACE INTO handle_challenges
+                    (guild, discord_id, cf_handle, token, channel, expires_at)
+                    VALUES
+                    (%s, %s, %s, %s, %s, %s)
+                """
+        with self.cursor() as curr:
+            curr.execute(query, (guild, discord_id, cf_handle, token, channel, expires_at))
+
+    def get_challenges(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT guild, discord_id, cf_handle, token, channel, expires_at FROM handle_challenges")
+            data = curr.fetchall()
+        return data
+
+    def remove_challenges(self, keys):
+        with self.cursor() as curr:
+            curr.executemany("DELETE FROM handle_challenges WHERE guild = %s AND discord_id = %s", keys)
 
     def get_problems(self, id=None):
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        if not id:
-            query = """
-                        SELECT * FROM problems
-                    """
-            curr.execute(query)
-        else:
-            query = """
-                        SELECT * FROM problems
-                        WHERE
-                        id = %s AND rank = %s
-                    """
-            curr.execute(query, (id.split('/')[0], id.split('/')[1]))
+        with self.cursor() as curr:
+            if not id:
+                query = """
+                            SELECT * FROM problems
+                        """
+                curr.execute(query)
+            else:
+                query = """
+                            SELECT * FROM problems
+                            WHERE
+                            id = %s AND rank = %s
+                        """
+                curr.execute(query, (id.split('/')[0], id.split('/')[1]))
 
-        res = curr.fetchall()
-        Problem = namedtuple('Problem', 'id rank name type rating used')
-        curr.close()
+            res = curr.fetchall()
+            Problem = namedtuple('Problem', 'id rank name type rating used')
         data = []
         for x in res:
             data.append(Problem(x[0], x[1], x[2], x[3], x[4], x[6]))
@@ -142,134 +390,355 @@ class Database:
         query = f"""
                     SELECT id from contests
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query)
-        data = curr.fetchall()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query)
+            data = curr.fetchall()
         return data
 
-    def get_contest_name(self, contest_id):
+    def get_problem_keys(self):
         query = f"""
-                    SELECT name FROM contests
-                    WHERE
-                    id = %s 
+                    SELECT id, rank, name FROM problems
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (contest_id,))
-        data = curr.fetchone()
-        curr.close()
-        #  print(id)
-        if len(data) == 0:
-            return "No data"
-        return data[0]
+        with self.cursor() as curr:
+            curr.execute(query)
+            data = curr.fetchall()
+        return set((x[0], x[1]) for x in data), set(x[2] for x in data)
 
-    def add_problem(self, id, rank, name, type, rating, used):
+    def add_problems(self, problems, batch_size=1000):
         query = f"""
                     INSERT INTO problems
                     (id, rank, name, type, rating, used)
                     VALUES
                     (%s, %s, %s, %s, %s, %s)
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (id, rank, name, type, rating, used))
-        self.conn.commit()
-        curr.close()
+        with self.cursor() as curr:
+            for i in range(0, len(problems), batch_size):
+                curr.executemany(query, problems[i:i + batch_size])
+
+    def get_problem_tags(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT id, rank, tag FROM problem_tags")
+            data = curr.fetchall()
+        return data
 
-    def add_potd(self, id, rank, name):
+    def add_problem_tags(self, tags, batch_size=1000):
         query = f"""
-                    ALTER TABLE handles
-                    ADD %s BOOL DEFAULT 0
+                    INSERT IGNORE INTO problem_tags
+                    (id, rank, tag)
+                    VALUES
+                    (%s, %s, %s)
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        date = datetime.today() - timedelta(hours = 7);
-        curr.execute(query % ('`' + 'solved_' + date.strftime('%Y-%m-%d') + '`',))
-        self.conn.commit()
-        curr.close()
+        with self.cursor() as curr:
+            for i in range(0, len(tags), batch_size):
+                curr.executemany(query, tags[i:i + batch_size])
+
+    def add_contests(self, contests, batch_size=1000):
+        query = f"""
+                    INSERT INTO contests
+                    (id, name)
+                    VALUES
+                    (%s, %s)
+                """
+        with self.cursor() as curr:
+            for i in range(0, len(contests), batch_size):
+                curr.executemany(query, contests[i:i + batch_size])
+
+    def get_sync_state(self, name):
+        query = f"""
+                    SELECT value FROM sync_state
+                    WHERE name = %s
+                """
+        with self.cursor() as curr:
+            curr.execute(query, (name,))
+            data = curr.fetchone()
+        if not data:
+            return None
+        return data[0]
+
+    def set_sync_state(self, values):
+        query = f"""
+                    REPLACE INTO sync_state
+                    (name, value)
+                    VALUES
+                    (%s, %s)
+                """
+        with self.cursor() as curr:
+            curr.executemany(query, list(values.items()))
+
+    def get_submission_cursors(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT cf_handle, last_submission FROM submission_cursors")
+            data = curr.fetchall()
+        return dict(data)
+
+    def set_submission_cursors(self, cursors):
+        query = f"""
+                    REPLACE INTO submission_cursors
+                    (cf_handle, last_submission)
+                    VALUES
+                    (%s, %s)
+                """
+        with self.cursor() as curr:
+            curr.executemany(query, list(cursors.items()))
+
+    def get_solved_problems(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT cf_handle, id, rank FROM solved_problems")
+            data = curr.fetchall()
+        return data
+
+    def get_synced_histories(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT cf_handle FROM solved_history")
+            data = curr.fetchall()
+        return [x[0] for x in data]
+
+    def add_solved_problems(self, rows, synced=()):
+        # rows of (cf_handle, id, rank), synced lists the handles whose whole history rows holds
+        with self.cursor() as curr:
+            curr.executemany("INSERT IGNORE INTO solved_problems (cf_handle, id, rank) VALUES (%s, %s, %s)", rows)
+            now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            curr.executemany("REPLACE INTO solved_history (cf_handle, synced_at) VALUES (%s, %s)",
+                             [(x, now) for x in synced])
 
+    def add_potd(self, guild, date, id, rank, name):
+        with self.cursor() as curr:
+            self.insert_potd(curr, guild, date, id, rank, name)
+
+    def insert_potd(self, curr, guild, date, id, rank, name):
         query = f"""
                     INSERT INTO potds
-                    (id, rank, name, use_date)
+                    (id, rank, name, use_date, guild)
                     VALUES
-                    (%s, %s, %s, %s)
+                    (%s, %s, %s, %s, %s)
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        date = datetime.today() - timedelta(hours = 7);
-        curr.execute(query, (id, rank, name, date.strftime('%Y-%m-%d')))
-        self.conn.commit()
-        curr.close()
-
-    def get_potd(self):
+        curr.execute(query, (id, rank, name, date, guild))
+        # streaks of users who missed the previous POTD end at the rollover
+        prev = self.prev_potd_date(curr, guild, date)
+        if prev is not None:
+            curr.execute("""
+                            UPDATE user_stats SET current_streak = 0
+                            WHERE guild = %s AND (last_solved_date IS NULL OR last_solved_date < %s)
+                        """, (guild, prev))
+
+    def get_potd_queue(self, guild):
+        query = f"""
+                    SELECT q.use_date, q.id, q.rank, q.name, p.rating FROM potd_queue q
+                    LEFT JOIN problems p ON p.id = q.id AND p.rank = q.rank
+                    WHERE q.guild = %s
+                    ORDER BY q.use_date
+                """
+        with self.cursor() as curr:
+            curr.execute(query, (guild,))
+            data = curr.fetchall()
+        return data
+
+    def update_potd_queue(self, guild, release, reserve):
+        # release: (use_date, id, rank) entries to drop and hand back to the pool, reserve: (use_date, id, rank, name)
+        with self.cursor() as curr:
+            curr.executemany("DELETE FROM potd_queue WHERE guild = %s AND use_date = %s", [(guild, x[0]) for x in release])
+            curr.executemany("UPDATE problems SET used = False WHERE id = %s AND rank = %s", [(x[1], x[2]) for x in release])
+            curr.executemany("""
+                                INSERT INTO potd_queue
+                                (guild, use_date, id, rank, name)
+                                VALUES
+                                (%s, %s, %s, %s, %s)
+                            """, [(guild, *x) for x in reserve])
+            curr.executemany("UPDATE problems SET used = True WHERE id = %s AND rank = %s", [(x[1], x[2]) for x in reserve])
+
+    def take_queued_potd(self, guild, date):
+        # moves the queued problem for date into potds, returns it or None when nothing was queued
+        with self.cursor() as curr:
+            curr.execute("SELECT id, rank, name FROM potd_queue WHERE guild = %s AND use_date = %s", (guild, date))
+            data = curr.fetchone()
+            if data is None:
+                return None
+            curr.execute("DELETE FROM potd_queue WHERE guild = %s AND use_date = %s", (guild, date))
+            self.insert_potd(curr, guild, date, *data)
+        Problem = namedtuple('Problem', 'id rank name')
+        return Problem(*data)
+
+    def prev_potd_date(self, curr, guild, date):
+        curr.execute("SELECT use_date FROM potds WHERE guild = %s AND use_date < %s ORDER BY use_date DESC LIMIT 1",
+                     (guild, date))
+        data = curr.fetchone()
+        return data[0] if data else None
+
+    def get_potd(self, guild, date):
         query = f"""
-                    SELECT * FROM potds
+                    SELECT id, rank, name FROM potds
                     WHERE
-                    use_date=%s
+                    guild = %s AND use_date = %s
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        date = datetime.today() - timedelta(hours = 7);
-        curr.execute(query, (date.strftime('%Y-%m-%d'),))
-        data = curr.fetchall()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query, (guild, date))
+            data = curr.fetchall()
 
         Problem = namedtuple('Problem', 'id rank name')
         if len(data) == 0:
             return None
         return Problem(data[-1][0], data[-1][1], data[-1][2])
 
-    def check_user_potd(self, cf_handle):
+    def get_potd_solvers(self, guild, date):
         query = f"""
-                    SELECT * FROM handles
-                    WHERE cf_handle=%s
+                    SELECT discord_id FROM potd_solves
+                    WHERE guild = %s AND potd_date = %s
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (cf_handle,))
-        data = curr.fetchone()
-        curr.close()
-        return data[-1]
-    
-    def set_user_potd(self, cf_handle):
-        query = f"""
-                    UPDATE handles
-                    SET %s = true
-                    WHERE cf_handle=%s
-                """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        date = datetime.today() - timedelta(hours = 7);
-        curr.execute(query % ('`' + 'solved_' + date.strftime('%Y-%m-%d') + '`', "'" + cf_handle + "'"))
-        self.conn.commit()
-        curr.close()
-
-    def set_used(self, id, rank, name):
+        with self.cursor() as curr:
+            curr.execute(query, (guild, date))
+            data = curr.fetchall()
+        return set(x[0] for x in data)
+
+    def add_solves(self, solves):
+        # (guild, date, discord_ids) triples, all committed in one transaction
+        with self.cursor() as curr:
+            for guild, date, discord_ids in solves:
+                if discord_ids:
+                    self.record_solves(curr, guild, date, discord_ids)
+
+    def record_solves(self, curr, guild, date, discord_ids):
         query = f"""
-                    UPDATE problems
-                    SET used=True
-                    WHERE id = %s AND rank = %s AND name = %s
+                    INSERT IGNORE INTO potd_solves
+                    (guild, discord_id, potd_date, solved_at)
+                    VALUES
+                    (%s, %s, %s, %s)
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (id, rank, name))
-        self.conn.commit()
-        curr.close()
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        curr.executemany(query, [(guild, x, date, now) for x in discord_ids])
+
+        # solves are saved in the background, and a poll may still be running when the next POTD goes out. A solve
+        # that lands after a later rollover reset the streaks is counted again from potd_solves, in order
+        curr.execute("SELECT 1 FROM potds WHERE guild = %s AND use_date > %s LIMIT 1", (guild, date))
+        if curr.fetchone() is not None:
+            self.recompute_user_stats(curr, guild, discord_ids)
+            return
+
+        prev = self.prev_potd_date(curr, guild, date)
+        curr.execute(f"""
+                        SELECT discord_id, current_streak, longest_streak, total_solves, last_solved_date FROM user_stats
+                        WHERE guild = %s AND discord_id IN ({', '.join(['%s'] * len(discord_ids))})
+                    """, (guild, *discord_ids))
+        stats = {x[0]: x[1:] for x in curr.fetchall()}
+        rows = []
+        for x in discord_ids:
+            current, longest, total, last = stats.get(x, (0, 0, 0, None))
+            if last == date:
+                continue
+            current = current + 1 if last is not None and last == prev else 1
+            rows.append((guild, x, current, max(longest, current), total + 1, date))
+        curr.executemany("""
+                            REPLACE INTO user_stats
+                            (guild, discord_id, current_streak, longest_streak, total_solves, last_solved_date)
+                            VALUES
+                            (%s, %s, %s, %s, %s, %s)
+                        """, rows)
 
-    def add_contest(self, id, name):
+    def get_leaderboard_stats(self, guild):
         query = f"""
-                    INSERT INTO contests
-                    (id, name)
-                    VALUES
-                    (%s, %s)
+                    SELECT s.discord_id, h.cf_handle, s.current_streak, s.total_solves FROM user_stats s
+                    JOIN handles h ON h.guild = s.guild AND h.discord_id = s.discord_id
+                    WHERE s.guild = %s
                 """
-        self.conn.reconnect()
-        curr = self.conn.cursor()
-        curr.execute(query, (id, name))
-        self.conn.commit()
-        curr.close()
+        with self.cursor() as curr:
+            curr.execute(query, (guild,))
+            data = curr.fetchall()
+        return data
+
+    def count_user_stats(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT COUNT(*) FROM user_stats")
+            data = curr.fetchone()
+        return data[0]
+
+    @staticmethod
+    def streak_stats(position, count, solved):
+        # position maps each of the guild's count POTD dates to its index, solved is one user's dates in order
+        run, longest, total, last, last_i = 0, 0, 0, None, None
+        for date in solved:
+            if date not in position:
+                continue
+            i = position[date]
+            run = run + 1 if last_i is not None and last_i == i - 1 else 1
+            longest = max(longest, run)
+            total += 1
+            last, last_i = date, i
+        # like the old column scan, the newest POTD doesn't break a streak until it rolls over
+        current = run if last_i is not None and last_i >= count - 2 else 0
+        return current, longest, total, last
+
+    def recompute_user_stats(self, curr, guild, discord_ids):
+        curr.execute("SELECT use_date FROM potds WHERE guild = %s ORDER BY use_date", (guild,))
+        dates = [x[0] for x in curr.fetchall()]
+        curr.execute(f"""
+                        SELECT discord_id, potd_date FROM potd_solves
+                        WHERE guild = %s AND discord_id IN ({', '.join(['%s'] * len(discord_ids))})
+                        ORDER BY discord_id, potd_date
+                    """, (guild, *discord_ids))
+        solved = {}
+        for discord_id, date in curr.fetchall():
+            solved.setdefault(discord_id, []).append(date)
+        position = {x: i for i, x in enumerate(dates)}
+        curr.executemany("""
+                            REPLACE INTO user_stats
+                            (guild, discord_id, current_streak, longest_streak, total_solves, last_solved_date)
+                            VALUES
+                            (%s, %s, %s, %s, %s, %s)
+                        """, [(guild, x, *self.streak_stats(position, len(dates), solved.get(x, []))) for x in discord_ids])
+
+    def rebuild_user_stats(self):
+        with self.cursor() as curr:
+            curr.execute("SELECT DISTINCT guild, use_date FROM potds ORDER BY guild, use_date")
+            dates = {}
+            for guild, date in curr.fetchall():
+                dates.setdefault(guild, []).append(date)
+            positions = {guild: {x: i for i, x in enumerate(dates[guild])} for guild in dates}
+            curr.execute("SELECT guild, discord_id FROM handles")
+            users = [(x[0], x[1]) for x in curr.fetchall()]
+            curr.execute("""
+                            SELECT guild, discord_id, potd_date FROM potd_solves
+                            ORDER BY guild, discord_id, potd_date
+                        """)
+            solved = {}
+            for guild, discord_id, date in curr.fetchall():
+                solved.setdefault((guild, discord_id), []).append(date)
+            rows = [(guild, discord_id, *self.streak_stats(positions.get(guild, {}), len(dates.get(guild, [])),
+                                                           solved.get((guild, discord_id), [])))
+                    for guild, discord_id in set(users)]
+            curr.execute("DELETE FROM user_stats")
+            curr.executemany("""
+                                INSERT INTO user_stats
+                                (guild, discord_id, current_streak, longest_streak, total_solves, last_solved_date)
+                                VALUES
+                                (%s, %s, %s, %s, %s, %s)
+                            """, rows)
+        print(f"Rebuilt stats for {len(rows)} users")
+
+
+class AsyncDatabase:
+    # runs Database methods on a thread pool so queries never block the discord event loop
+    def __init__(self, db):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=db.pool_size, thread_name_prefix='database')
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        # time spent queued for a worker is kept apart from the call itself
+        def timed(queued, *args, **kwargs):
+            metrics.observe('database_queue_seconds', time.perf_counter() - queued)
+            with metrics.timer('database_call_seconds', method=name):
+                return method(*args, **kwargs)
 
+        @functools.wraps(method)
+        async def run(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(timed, time.perf_counter(), *args, **kwargs))
 
+        setattr(self, name, run)
+        return run
 
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.backend.close()
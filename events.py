@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+from collections import deque, namedtuple
+from datetime import date
+
+# with worker_socket set, worker.py does the Codeforces polling, problemset refresh and POTD selection in a
+# process of its own and tells the gateway what to post with these events; without it main.py handles them itself
+
+# worker -> gateway
+PostPotd = namedtuple('PostPotd', 'guild channel role date id rank name')
+SolvesSaved = namedtuple('SolvesSaved', 'guild channel date discord_ids')
+AdminWarning = namedtuple('AdminWarning', 'guild channel text')
+LeaderboardChanged = namedtuple('LeaderboardChanged', 'guild')
+ProblemsChanged = namedtuple('ProblemsChanged', '')
+
+# gateway -> worker
+GuildConfigured = namedtuple('GuildConfigured', 'guild')
+PollRequested = namedtuple('PollRequested', '')
+
+EVENTS = {x.__name__: x for x in [PostPotd, SolvesSaved, AdminWarning, LeaderboardChanged, ProblemsChanged,
+                                  GuildConfigured, PollRequested]}
+
+
+def encode(event):
+    fields = {key: value.isoformat() if key == 'date' else value for key, value in event._asdict().items()}
+    return json.dumps({'event': type(event).__name__, **fields}).encode() + b'\n'
+
+
+def decode(line):
+    data = json.loads(line)
+    event = EVENTS[data.pop('event')]
+    if 'date' in data:
+        data['date'] = date.fromisoformat(data['date'])
+    return event(**data)
+
+
+class EventLink:
+    # newline-delimited JSON events over a Unix socket, the gateway listens and the worker connects.
+    # Events sent while the other side is away are kept, up to backlog, and go out once it's back
+    def __init__(self, handler, backlog=1000):
+        self.handler = handler
+        self.pending = deque(maxlen=backlog)
+        self.writer = None
+        self.server = None
+        self.task = None
+
+    def send(self, event):
+        if self.writer is None or self.writer.is_closing():
+            self.pending.append(event)
+            return
+        self.writer.write(encode(event))
+
+    async def listen(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = await asyncio.start_unix_server(self.accept, path)
+        os.chmod(path, 0o600)
+
+    async def accept(self, reader, writer):
+        # a restarted worker replaces the old connection
+        if self.writer is not None:
+            self.writer.close()
+        await self.serve(reader, writer)
+
+    async def connect(self, path, retry_delay=1):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+            except OSError:
+                await asyncio.sleep(retry_delay)
+                continue
+            await self.serve(reader, writer)
+            print("Lost the event link, reconnecting")
+            await asyncio.sleep(retry_delay)
+
+    async def serve(self, reader, writer):
+        self.writer = writer
+        self.task = asyncio.current_task()
+        while self.pending:
+            writer.write(encode(self.pending.popleft()))
+        try:
+            while line := await reader.readline():
+                try:
+                    await self.handler(decode(line))
+                except Exception as e:
+                    print(f"Error while handling event {line[:200]!r}: {e}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+
+    async def close(self):
+        # closing the connection ends its reader at EOF, which is waited for so no handler is cut off
+        if self.writer is not None:
+            self.writer.close()
+        if self.task is not None and self.task is not asyncio.current_task():
+            await asyncio.wait([self.task], timeout=5)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
@@ -0,0 +1,57 @@
+import codecs
+import json
+import re
+
+
+class ArrayStreamParser:
+    # decodes the items of the first array stored under key as the bytes arrive, without building the whole document
+    def __init__(self, key):
+        self.marker = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk):
+        if self.finished:
+            return []
+        self.buffer += self.text_decoder.decode(chunk)
+        items = []
+        if not self.started:
+            match = self.marker.search(self.buffer)
+            if match is None:
+                # keep a tail in case the key is split across chunks
+                self.buffer = self.buffer[-64:]
+                return items
+            self.buffer = self.buffer[match.end():]
+            self.started = True
+        pos = 0
+        while True:
+            while pos < len(self.buffer) and self.buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(self.buffer):
+                break
+            if self.buffer[pos] == ']':
+                self.finished = True
+                break
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, pos)
+            except ValueError:
+                # the item continues in the next chunk
+                break
+            items.append(item)
+            pos = end
+        self.buffer = self.buffer[pos:]
+        return items
+
+    def close(self):
+        if not self.finished:
+            raise ValueError("JSON stream ended before the array was complete")
+
+
+def iter_array(chunks, key):
+    parser = ArrayStreamParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
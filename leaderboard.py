@@ -0,0 +1,62 @@
+import asyncio
+import bisect
+from collections import namedtuple
+
+Entry = namedtuple('Entry', 'score handle discord_id')
+
+
+class Leaderboard:
+    # users ordered by score, tied users share a place like "1, 1, 3"
+    def __init__(self, rows):
+        self.entries = sorted((Entry(score, handle, discord_id) for discord_id, handle, score in rows),
+                              key=lambda x: (-x.score, x.handle.lower()))
+        self.negated = [-x.score for x in self.entries]
+        self.scores = {x.discord_id: x.score for x in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def place(self, score):
+        return bisect.bisect_left(self.negated, -score) + 1
+
+    def rank(self, discord_id):
+        if discord_id not in self.scores:
+            return None
+        score = self.scores[discord_id]
+        return self.place(score), score
+
+    def pages(self, per_page=20):
+        return max(1, (len(self.entries) + per_page - 1) // per_page)
+
+    def page(self, number, per_page=20):
+        number = max(1, min(number, self.pages(per_page)))
+        start = (number - 1) * per_page
+        return number, [(self.place(x.score), x) for x in self.entries[start:start + per_page]]
+
+
+class LeaderboardCache:
+    # one ranked view per guild, rebuilt from a single query the first time it's asked for after a change
+    def __init__(self, db):
+        self.db = db
+        self.boards = {}
+        self.locks = {}
+        self.generation = {}
+
+    async def get(self, guild, kind):
+        if guild not in self.boards:
+            async with self.locks.setdefault(guild, asyncio.Lock()):
+                if guild not in self.boards:
+                    generation = self.generation.setdefault(guild, 0)
+                    rows = await self.db.get_leaderboard_stats(guild)
+                    boards = {'streak': Leaderboard([(x[0], x[1], x[2]) for x in rows]),
+                              'solves': Leaderboard([(x[0], x[1], x[3]) for x in rows])}
+                    # a solve landing while the query ran leaves the view uncached so the next call sees it
+                    if self.generation[guild] != generation:
+                        return boards[kind]
+                    self.boards[guild] = boards
+        return self.boards[guild][kind]
+
+    def invalidate(self, guild=None):
+        for x in list(self.generation) if guild is None else [guild]:
+            self.generation[x] = self.generation.get(x, 0) + 1
+            self.boards.pop(x, None)
@@ -0,0 +1,99 @@
+import asyncio
+from collections import Counter
+from datetime import timedelta
+
+from scheduler import potd_day
+
+
+class PotdQueue:
+    # the next `days` POTDs of every guild are picked and reserved ahead of time, so the rollover itself
+    # only moves today's queued problem into potds
+    def __init__(self, db, problems, solved=None, days=7, low_weeks=4):
+        self.db = db
+        self.problems = problems
+        # a SolvedIndex, problems many of the guild's members already solved are picked less often
+        self.solved = solved
+        self.days = days
+        self.low_weeks = low_weeks
+        self.warned = {}
+        # the rollover, the hourly job and config changes can all fill a guild at once, one at a time it is
+        self.locks = {}
+
+    async def fill(self, config):
+        # returns warnings for the guild's admins, both days that couldn't be filled and ratings running low
+        async with self.locks.setdefault(config.guild, asyncio.Lock()):
+            return await self.plan(config)
+
+    async def plan(self, config):
+        today = potd_day(config.timezone).date()
+        queue = await self.db.get_potd_queue(config.guild)
+        warnings = []
+        # a theme is a tag query such as "dp, not interactive" that every queued problem has to match
+        include, exclude = (), ()
+        if config.theme:
+            try:
+                _, include, exclude = self.problems.parse_query(config.theme)
+            except ValueError as e:
+                if self.warned.get((config.guild, config.theme)) != today:
+                    self.warned[(config.guild, config.theme)] = today
+                    warnings.append(f"Ignoring the theme {config.theme}: {e}")
+
+        def fits(x):
+            # a day the theme has no problem left for keeps what it has rather than being picked again every fill
+            return (not (include or exclude) or self.problems.matches(x[1], x[2], include, exclude)
+                    or not self.problems.count(x[4], include, exclude))
+        # entries for days that already passed, or whose rating or theme no longer matches, are reused
+        # for other days of the same rating or handed back to the pool
+        stale = [x for x in queue if x[0] < today or x[4] != config.difficulties[x[0].weekday()] or not fits(x)]
+        queued = set(x[0] for x in queue if x not in stale)
+        release, reserve, missing, unthemed, sampled = [], [], [], [], []
+        for offset in range(self.days):
+            date = today + timedelta(days=offset)
+            if date in queued or (offset == 0 and await self.db.get_potd(config.guild, date) is not None):
+                continue
+            rating = config.difficulties[date.weekday()]
+            reuse = next((x for x in stale if x[4] == rating and fits(x)), None)
+            if reuse is not None:
+                stale.remove(reuse)
+                release.append(reuse[:3])
+                reserve.append((date, reuse[1], reuse[2], reuse[3]))
+                continue
+            weight = self.solved.penalty(config.guild) if self.solved else None
+            problem = self.problems.sample(rating, weight, include, exclude)
+            if problem is None and (include or exclude):
+                problem = self.problems.sample(rating, weight)
+                unthemed.append((date, rating))
+            if problem is None:
+                missing.append((date, rating))
+                continue
+            self.problems.remove(problem.id, problem.rank)
+            sampled.append(problem)
+            reserve.append((date, problem.id, problem.rank, problem.name))
+        release += [x[:3] for x in stale]
+        if release or reserve:
+            try:
+                await self.db.update_potd_queue(config.guild, release, reserve)
+            except Exception:
+                for x in sampled:
+                    self.problems.restore(x.id, x.rank)
+                raise
+            for x in stale:
+                self.problems.restore(x[1], x[2])
+
+        # each warning is given once a day
+        for date, rating in unthemed:
+            if self.warned.get((config.guild, date, 'theme')) != today:
+                self.warned[(config.guild, date, 'theme')] = today
+                warnings.append(f"No problem with rating {rating} matches the theme {config.theme}, "
+                                f"the POTD on {date.strftime('%m/%d/%Y')} is outside it")
+        for date, rating in missing:
+            if self.warned.get((config.guild, date)) != today:
+                self.warned[(config.guild, date)] = today
+                warnings.append(f"No problem with rating {rating} is left for the POTD on {date.strftime('%m/%d/%Y')}")
+        for rating, uses in Counter(config.difficulties).items():
+            left = self.problems.count(rating)
+            if left < self.low_weeks * uses and self.warned.get((config.guild, rating)) != today:
+                self.warned[(config.guild, rating)] = today
+                warnings.append(f"Only {left} unused problems with rating {rating} are left, "
+                                f"about {left // uses} weeks of POTDs")
+        return warnings
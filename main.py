@@ -1,8 +1,7 @@
 import os
-import random
 import asyncio
-from datetime import datetime, timedelta
-import math
+import random
+import time
 
 import discord
 from discord import Embed, Color
@@ -10,14 +9,25 @@ from discord.ext import commands
 
 import database
 import cf_api
-
-from constants import POTD_PROBLEMS, POTD_GUILD, POTD_ANNOUNCE
+import solvers
+import problem_index
+import snapshots
+import problemset
+import leaderboard
+import verification
+import outbox
+import lookahead
+import solved_index
+import ratings
+import events
+from metrics import metrics
+from profiler import SamplingProfiler
+
+from constants import POTD_DIFFICULTIES, POTD_TIMEZONE
 
 from collections import namedtuple
-import string
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from scheduler import PotdScheduler, potd_day
 
 from dotenv import load_dotenv
 
@@ -25,7 +35,19 @@ TOKEN = os.getenv("token");
 
 bot = commands.Bot(command_prefix='.', intents=discord.Intents.all())
 
-global db, cf
+db, cf, tracker, problems = None, None, None, None
+potd_scheduler = None
+leaderboards = None
+verifier = None
+solve_writer, announcer = None, None
+potd_queue = None
+solved_history = None
+rating_sync = None
+# worker_link is the gateway's connection to worker.py, gateway_link the worker's connection back
+worker_link, gateway_link = None, None
+problems_stale = False
+snapshot_store = snapshots.SnapshotStore()
+profiler = SamplingProfiler()
 
 cf_colors = {
     'unrated': 0x000000,
@@ -43,33 +65,67 @@ cf_colors = {
 
 @bot.event
 async def on_ready():
-    global db, cf
+    global db, cf, leaderboards, verifier, announcer, worker_link, problems_stale
     print(f'{bot.user} has connected to Discord')
+    # on_ready fires again after every gateway reconnect
+    if db is not None:
+        return
 
-    db = database.Database()
+    db = database.AsyncDatabase(await asyncio.to_thread(database.Database))
     cf = cf_api.CodeforcesAPI()
+    leaderboards = leaderboard.LeaderboardCache(db)
+    verifier = verification.HandleVerifier(db, cf, handle_verified, handle_expired)
+    announcer = outbox.Announcer(bot, reaction="<:orz:1105018917828698204>")
+    # challenges issued before a restart are picked up again
+    verifier.start()
     print('Database and CF API initialized')
-
-    await update_problemset()
+    if os.getenv("metrics_port"):
+        await metrics.serve(os.getenv("metrics_host", "127.0.0.1"), int(os.getenv("metrics_port")))
+
+    if os.getenv("worker_socket"):
+        # worker.py does the syncing, this process builds its own problem index when a tag query needs one
+        problems_stale = True
+        worker_link = events.EventLink(handle_event)
+        await worker_link.listen(os.getenv("worker_socket"))
+        print('Waiting for the worker')
+    else:
+        await start_sync()
+
+async def start_sync():
+    # the Codeforces polling, problemset refresh and POTD selection, see worker.py for running them apart
+    global tracker, problems, potd_scheduler, solve_writer, potd_queue, solved_history, rating_sync
+    tracker = solvers.SolverTracker(cf, db, mode=os.getenv("solve_detection", "recent"))
+    await tracker.load()
+    problems = problem_index.ProblemIndex(await db.get_problems(), await db.get_problem_tags())
+    solved_history = solved_index.SolvedHistory(db, cf, solved_index.SolvedIndex())
+    await solved_history.load()
+    potd_queue = lookahead.PotdQueue(db, problems, solved_history.index)
+    rating_sync = ratings.RatingSync(db, cf, chunk_size=cf.batch_size)
+    solve_writer = outbox.SolveWriter(db, solves_saved)
+
+    if await load_problemset_snapshot():
+        asyncio.create_task(refresh_problemset_in_background())
+    else:
+        await refresh_problemset(max_age=0)
     print('Problemset updated')
 
-    if (db.get_potd() is None):
-        await select_potd()
-    # await update_solvers()
-    # print('Solvers updated')
-
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(select_potd, 'interval', minutes=10)
-    scheduler.add_job(update_solvers, 'interval', minutes=1)
-    scheduler.start()
+    # a recent mode tick is one request however many handles there are, and backing off would let more than the
+    # feed's recent_count submissions pile up between ticks, which costs a user.status sweep to cover
+    potd_scheduler = PotdScheduler(select_potd, update_solvers, slow_interval=60 if tracker.mode == 'recent' else 600)
+    potd_scheduler.add_job(refresh_problemset, 'interval', hours=6)
+    potd_scheduler.add_job(fill_potd_queues, 'interval', hours=1)
+    potd_scheduler.add_job(solved_history.sync, 'interval', hours=1)
+    potd_scheduler.add_job(sync_ratings, 'interval', hours=6)
+    await potd_scheduler.start([(x.guild, x.timezone) for x in await db.get_guild_configs()])
+    asyncio.create_task(sync_and_fill())
 
 @bot.command(name='identify_handle', help='Set your CF handle')
 async def identify_handle(ctx, handle: str=None):
     if handle is None:
         await ctx.send("Please specify a Codeforces handle.")
         return
-    if db.get_handle(ctx.guild.id, ctx.author.id):
-        await ctx.send(f"Your handle is already set to {db.get_handle(ctx.guild.id, ctx.author.id)}, "
+    if await db.get_handle(ctx.guild.id, ctx.author.id):
+        await ctx.send(f"Your handle is already set to {await db.get_handle(ctx.guild.id, ctx.author.id)}, "
                                 f"ask an admin or mod to remove it first and try again.")
         return
 
@@ -82,36 +138,47 @@ async def identify_handle(ctx, handle: str=None):
     handle = data['handle']
     
     # 2 discord users setting same handle
-    handles = list(filter(lambda x: x[2] == handle, db.get_all_handles(ctx.guild.id)))
+    handles = list(filter(lambda x: x[2] == handle, await db.get_all_handles(ctx.guild.id)))
     if len(handles):
         await ctx.send('That handle is already in use')
         return
     
-    res = ''.join(random.choices(string.ascii_uppercase + string.digits, k=15))
+    token = await verifier.challenge(ctx.guild.id, ctx.author.id, handle, ctx.channel.id)
     await ctx.send(
                         f"Please change your first name on https://codeforces.com/settings/social to "
-                        f"`{res}` within 30 seconds {ctx.author.mention}")
-    await asyncio.sleep(30)
+                        f"`{token}` within {verifier.timeout // 60} minutes {ctx.author.mention}")
 
-    if res != await cf.get_first_name(handle):
-        await ctx.send(f"Unable to set handle, please try again {ctx.author.mention}")
+async def handle_verified(challenge, data):
+    channel = bot.get_channel(challenge.channel)
+    mention = f"<@{challenge.discord_id}>"
+    handle = data['handle']
+    # the handle may have been taken while the challenge was pending
+    if await db.get_handle(challenge.guild, challenge.discord_id):
+        await channel.send(f"Your handle is already set to {await db.get_handle(challenge.guild, challenge.discord_id)} {mention}")
+        return
+    handles = list(filter(lambda x: x[2] == handle, await db.get_all_handles(challenge.guild)))
+    if len(handles):
+        await channel.send(f'That handle is already in use {mention}')
         return
 
-    member = ctx.author
     if "rating" not in data:
         rating = 0
         rank = "unrated"
     else:
         rating = data['rating']
         rank = data['rank']
-    db.add_handle(ctx.guild.id, member.id, handle, rating)
+    await db.add_handle(challenge.guild, challenge.discord_id, handle, rating, rank, data['titlePhoto'])
+    leaderboards.invalidate(challenge.guild)
     embed = discord.Embed(
-        description=f'Handle for {member.mention} successfully set to [{handle}](https://codeforces.com/profile/{handle})',
+        description=f'Handle for {mention} successfully set to [{handle}](https://codeforces.com/profile/{handle})',
         color=Color(cf_colors[rank.lower()]))
     embed.add_field(name='Rank', value=f'{rank}', inline=True)
     embed.add_field(name='Rating', value=f'{rating}', inline=True)
     embed.set_thumbnail(url=f"{data['titlePhoto']}")
-    await ctx.send(embed=embed)
+    await channel.send(embed=embed)
+
+async def handle_expired(challenge):
+    await bot.get_channel(challenge.channel).send(f"Unable to set handle, please try again <@{challenge.discord_id}>")
 
 def has_admin_privilege(ctx):
     if ctx.channel.permissions_for(ctx.author).manage_guild:
@@ -136,11 +203,11 @@ async def set_handle(ctx, member: discord.Member=None, handle: str=None):
         return
 
     handle = data[1]['handle']
-    if db.get_handle(ctx.guild.id, member.id):
-        await ctx.send(f"Handle for user {member.mention} already set to {db.get_handle(ctx.guild.id, member.id)}")
+    if await db.get_handle(ctx.guild.id, member.id):
+        await ctx.send(f"Handle for user {member.mention} already set to {await db.get_handle(ctx.guild.id, member.id)}")
         return
     # 2 discord users setting same handle
-    handles = list(filter(lambda x: x[2] == handle, db.get_all_handles(ctx.guild.id)))
+    handles = list(filter(lambda x: x[2] == handle, await db.get_all_handles(ctx.guild.id)))
     if len(handles):
         await ctx.send('That handle is already in use')
         return
@@ -153,7 +220,8 @@ async def set_handle(ctx, member: discord.Member=None, handle: str=None):
     else:
         rating = data['rating']
         rank = data['rank']
-    db.add_handle(ctx.guild.id, member.id, handle, rating)
+    await db.add_handle(ctx.guild.id, member.id, handle, rating, rank, data['titlePhoto'])
+    leaderboards.invalidate(ctx.guild.id)
     embed = discord.Embed(
         description=f'Handle for user {member.mention} successfully set to [{handle}](https://codeforces.com/profile/{handle})',
         color=Color(cf_colors[rank.lower()]))
@@ -166,28 +234,24 @@ async def set_handle(ctx, member: discord.Member=None, handle: str=None):
 async def get_handle(ctx, member: discord.Member=None):
     if member is None:
         member = ctx.author
-    if not db.get_handle(ctx.guild.id, member.id):
+    if not await db.get_handle(ctx.guild.id, member.id):
         await ctx.send(f'Handle for {member.mention} is not set currently')
         return
-    handle = db.get_handle(ctx.guild.id, member.id)
-    data = await cf.check_handle(handle)
-    if not data[0]:
-        await ctx.send(data[1])
-        return
-
-    data = data[1]
-    if "rating" not in data:
-        rating = 0
-        rank = "unrated"
-    else:
-        rating = data['rating']
-        rank = data['rank']
+    handle, rating, rank, title_photo = await db.get_handle_info(ctx.guild.id, member.id)
+    # kept current by sync_ratings, only handles registered before the rank was stored are looked up
+    if rank is None:
+        data = await cf.check_handle(handle)
+        if not data[0]:
+            await ctx.send(data[1])
+            return
+        data = data[1]
+        rating, rank, title_photo = data.get('rating', 0), data.get('rank', 'unrated'), data['titlePhoto']
     embed = discord.Embed(
         description=f'Handle for {member.mention} currently set to [{handle}](https://codeforces.com/profile/{handle})',
         color=Color(cf_colors[rank.lower()]))
     embed.add_field(name='Rank', value=f'{rank}', inline=True)
     embed.add_field(name='Rating', value=f'{rating}', inline=True)
-    embed.set_thumbnail(url=f"{data['titlePhoto']}")
+    embed.set_thumbnail(url=f"{title_photo}")
     await ctx.send(embed=embed)
 
 @bot.command(name="remove_handle", help="Remove someone's handle (Admin/Mod/Lockout Manager only)")
@@ -197,145 +261,447 @@ async def remove_handle(ctx, member: discord.Member=None):
     if not has_admin_privilege(ctx):
         await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
         return
-    if not db.get_handle(ctx.guild.id, member.id):
+    if not await db.get_handle(ctx.guild.id, member.id):
         await ctx.send(f"Handle for {member.mention} not set")
         return
 
-    db.remove_handle(ctx.guild.id, member.id)
+    await db.remove_handle(ctx.guild.id, member.id)
+    leaderboards.invalidate(ctx.guild.id)
     await ctx.send(
         embed=Embed(description=f"Handle for {member.mention} removed successfully", color=Color.green()))
 
-def isNonStandard(contest_name):
-    names = [
-        'wild', 'fools', 'unrated', 'surprise', 'unknown', 'friday', 'q#', 'testing',
-        'marathon', 'kotlin', 'onsite', 'experimental', 'abbyy']
-    for x in names:
-        if x in contest_name.lower():
-            return True
-    return False
-
-async def update_problemset():
-    contest_id = [x[0] for x in db.get_contests_id()]
-    problem_id = [x.name for x in db.get_problems()]
-    contest_list = await cf.get_contest_list()
-    problem_list = await cf.get_problem_list()
-
-    # print(problem_list);
-
-    mapping = {}
-
-    con_cnt, prob_cnt = 0, 0
-
-    for contest in contest_list:
-        mapping[contest['id']] = contest['name']
-        if contest['id'] not in contest_id and contest['phase'] == "FINISHED" and not isNonStandard(contest['name']):
-            con_cnt += 1
-            db.add_contest(contest['id'], contest['name'].encode('ascii','replace').decode("ascii"));
-
-    for problem in problem_list:
-        problemName = problem['name'].encode('ascii','replace').decode("ascii");
-        if problem['contestId'] in mapping and not isNonStandard(mapping[problem['contestId']]) and 'rating' in problem and problemName not in problem_id:
-            prob_cnt += 1
-            db.add_problem(problem['contestId'], problem['index'], problemName, problem['type'], problem['rating'], False)
-
-async def find_problem(rating):
-    all_problems = db.get_problems()
-
-    problem = None
-    options = [p for p in all_problems if p.rating == rating and p.used == 0]
-    weights = [int(p.id * math.sqrt(p.id)) for p in options]
-    if options:
-        return random.choices(options, weights, k=1)
-    if not problem:
-        return [False, f"Not enough problems with rating {rating} left!"]
+async def load_problemset_snapshot():
+    if not snapshot_store.exists('problemset') or not snapshot_store.exists('contests'):
+        return False
+    try:
+        await update_problemset(snapshot_store.meta('problemset')['hash'])
+    except (OSError, ValueError, EOFError) as e:
+        print(f'Unable to read problemset snapshot: {e}')
+        return False
+    return True
+
+async def refresh_problemset(max_age=60 * 60):
+    # restarts within max_age of the last download reuse the snapshot instead of hitting Codeforces
+    age = snapshot_store.age('problemset')
+    if age is not None and age < max_age:
+        return
+    writer = snapshot_store.writer('problemset')
+    digest = await cf.download_problem_list(writer.write)
+    if digest is None:
+        writer.abort()
+        print('Unable to fetch problemset, keeping snapshot')
+        return
+    meta = snapshot_store.meta('problemset')
+    if meta is not None and meta['hash'] == digest:
+        writer.abort()
+        snapshot_store.touch('problemset', digest)
+        # the snapshot may be newer than the database if the last import failed, update_problemset retries it
+        await update_problemset(digest)
+        return
+    contest_writer = snapshot_store.writer('contests')
+    contest_digest = await cf.download_contest_list(contest_writer.write)
+    if contest_digest is None:
+        writer.abort()
+        contest_writer.abort()
+        print('Unable to fetch contest list, keeping snapshot')
+        return
+    contest_writer.commit(contest_digest)
+    writer.commit(digest)
+    await update_problemset(digest)
+
+async def refresh_problemset_in_background():
+    # a failed refresh is retried by the 6-hourly job
+    try:
+        await refresh_problemset()
+    except Exception as e:
+        print(f"Error while refreshing the problemset: {e}")
+
+async def update_problemset(digest):
+    if digest == await db.get_sync_state('problemset_hash'):
+        print('Problemset unchanged')
+        return
 
-potd_difficulties = [800, 1200, 900, 1300, 1000, 1600, 1400]
-async def select_potd():
-    if (db.get_potd() is not None):
+    contest_id = set(x[0] for x in await db.get_contests_id())
+    problem_keys, problem_names = await db.get_problem_keys()
+    # both payloads are parsed item by item straight from the snapshot files, off the event loop
+    new_contests, new_problems, new_tags = await asyncio.to_thread(
+        problemset.diff_problemset, cf_api.iter_contests(snapshot_store.chunks('contests')),
+        cf_api.iter_problems(snapshot_store.chunks('problemset')), contest_id, problem_keys, problem_names,
+        problems.tagged())
+
+    await db.add_contests(new_contests)
+    await db.add_problems(new_problems)
+    await db.add_problem_tags(new_tags)
+    for problem in new_problems:
+        problems.add(*problem)
+    for id, rank, tag in new_tags:
+        problems.add_tags(id, rank, [tag])
+    if new_problems or new_tags:
+        await emit(events.ProblemsChanged())
+    await db.set_sync_state({'problemset_hash': digest})
+    print(f'Added {len(new_contests)} contests and {len(new_problems)} problems')
+
+async def emit(event):
+    # from the worker the event goes to the gateway process, everywhere else it's handled right here
+    if gateway_link is not None:
+        gateway_link.send(event)
+    else:
+        await handle_event(event)
+
+async def handle_event(event):
+    global problems_stale
+    with metrics.timer('event_seconds', event=type(event).__name__):
+        if isinstance(event, events.PostPotd):
+            leaderboards.invalidate(event.guild)
+            msg = await bot.get_channel(event.channel).send(f"<@&{event.role}>" if event.role else None,
+                embed=Embed(title="POTD " + event.date.strftime('%m/%d/%Y'), description=f"\n[{event.name}](https://codeforces.com/contest/{event.id}/problem/{event.rank})", color=Color.blue()))
+            await msg.publish()
+        elif isinstance(event, events.SolvesSaved):
+            leaderboards.invalidate(event.guild)
+            if event.channel is not None:
+                announcer.announce(event.channel, event.date.strftime('%m/%d/%Y'), event.discord_ids)
+        elif isinstance(event, events.AdminWarning):
+            await bot.get_channel(event.channel).send(event.text)
+        elif isinstance(event, events.LeaderboardChanged):
+            leaderboards.invalidate(event.guild)
+        elif isinstance(event, events.ProblemsChanged) and worker_link is not None:
+            problems_stale = True
+
+async def command(event):
+    # the gateway's counterpart of emit, for commands that need the syncing side
+    if worker_link is not None:
+        worker_link.send(event)
+    else:
+        await handle_command(event)
+
+async def handle_command(event):
+    if isinstance(event, events.GuildConfigured):
+        config = await db.get_guild_config(event.guild)
+        potd_scheduler.add_guild(config.guild, config.timezone)
+        if config.problems_channel is not None:
+            # queued days follow the old difficulties and timezone, plan them again
+            await refill_potd_queue(config)
+    elif isinstance(event, events.PollRequested):
+        await update_solvers()
+
+async def current_problems():
+    # with a worker the gateway's copy is only rebuilt when an admin command asks for it, not on every change
+    global problems, problems_stale
+    if problems_stale:
+        problems_stale = False
+        problems = await asyncio.to_thread(problem_index.ProblemIndex, await db.get_problems(), await db.get_problem_tags())
+    return problems
+
+async def warn_admins(config, warnings):
+    for warning in warnings:
+        print(f"Guild {config.guild}: {warning}")
+        if config.admin_channel is not None:
+            await emit(events.AdminWarning(config.guild, config.admin_channel, warning))
+
+async def sync_ratings():
+    renamed, missing = await rating_sync.sync()
+    for old, new in renamed:
+        solved_history.index.rename(old, new)
+    missing = set(x.lower() for x in missing)
+    if not renamed and not missing:
+        return
+    await emit(events.LeaderboardChanged(None))
+    handles = await db.get_all_handles()
+    for config in await db.get_guild_configs():
+        gone = [f"<@{discord_id}> ({handle})" for guild, discord_id, handle, _ in handles
+                if guild == config.guild and handle.lower() in missing]
+        if gone:
+            await warn_admins(config, [f"These Codeforces handles no longer exist: {', '.join(gone)}"])
+
+async def fill_potd_queue(config):
+    await warn_admins(config, await potd_queue.fill(config))
+    await emit(events.ProblemsChanged())
+
+async def sync_and_fill():
+    # the first fill after a start waits for the histories of newly registered handles
+    try:
+        await solved_history.sync()
+    except Exception as e:
+        print(f"Error while loading solve histories: {e}")
+    await fill_potd_queues()
+
+async def fill_potd_queues():
+    for config in await db.get_guild_configs():
+        if config.problems_channel is None:
+            continue
+        await refill_potd_queue(config)
+
+async def refill_potd_queue(config):
+    # for fills nothing waits on, a failed one is retried by the hourly job
+    try:
+        await fill_potd_queue(config)
+    except Exception as e:
+        print(f"Error while filling the POTD queue of guild {config.guild}: {e}")
+
+async def select_potd(guild):
+    config = await db.get_guild_config(guild)
+    if config is None or config.problems_channel is None:
+        return
+    date = potd_day(config.timezone)
+    if (await db.get_potd(guild, date.date()) is not None):
         return;
-    date = datetime.today() - timedelta(hours = 7);
-    diff = potd_difficulties[date.weekday()]
-    problem = (await find_problem(diff))[0]
-    db.add_potd(id=problem.id, rank=problem.rank, name=problem.name)
-    db.set_used(id=problem.id, rank=problem.rank, name=problem.name)
-    msg = await bot.get_channel(POTD_PROBLEMS).send("<@&1120846668833771560>", 
-        embed=Embed(title="POTD " + date.strftime('%m/%d/%Y'), description=f"\n[{problem.name}](https://codeforces.com/contest/{problem.id}/problem/{problem.rank})", color=Color.blue()))
-    await msg.publish()
+    problem = await db.take_queued_potd(guild, date.date())
+    if problem is None:
+        # nothing queued yet for a new guild, or the queue ran dry
+        await fill_potd_queue(config)
+        problem = await db.take_queued_potd(guild, date.date())
+        if problem is None:
+            return
+    await emit(events.PostPotd(guild, config.problems_channel, config.role, date.date(), problem.id, problem.rank, problem.name))
+    asyncio.create_task(refill_potd_queue(config))
 
 @bot.command(name="get_potd", help="Get the current POTD")
 async def get_potd(ctx):
-    problem = db.get_potd()
-    date = datetime.today() - timedelta(hours = 7);
+    config = await db.get_guild_config(ctx.guild.id)
+    if config is None:
+        await ctx.send("POTD is not set up in this server")
+        return
+    date = potd_day(config.timezone)
+    problem = await db.get_potd(ctx.guild.id, date.date())
+    if problem is None:
+        await ctx.send("There is no POTD yet today")
+        return
     await ctx.send(
         embed=Embed(title="POTD " + date.strftime('%m/%d/%Y'), description=f"\n[{problem.name}](https://codeforces.com/contest/{problem.id}/problem/{problem.rank})", color=Color.blue()))
     
-async def check_solved(handle, id, index):
-    subs = await cf.get_user_problems(handle, 50)
-    if not subs[0]: return False
-    for x in subs[1]:
-        if x.id == int(id) and x.index == index:
-            if x.verdict == 'OK':
-                return True
-    return False
-
 async def update_solvers():
-    problem = db.get_potd()
-    if problem is None: return
-    users = db.get_all_handles(POTD_GUILD)
-    for user in users:
-        if await check_solved(user[2], problem.id, problem.rank) and not db.check_user_potd(user[2]):
-            db.set_user_potd(user[2])
-            date = datetime.today() - timedelta(hours = 7);
-            msg = await bot.get_channel(POTD_ANNOUNCE).send(f"Congratulations to <@{user[1]}> for solving POTD " + date.strftime('%m/%d/%Y') + "!")
-            await msg.publish()
-            await msg.add_reaction("<:orz:1105018917828698204>")
+    # every guild's POTD is checked in the same tick, a handle registered in several guilds is fetched once
+    targets = []
+    for config in await db.get_guild_configs():
+        date = potd_day(config.timezone)
+        problem = await db.get_potd(config.guild, date.date())
+        if problem is not None:
+            solved = await db.get_potd_solvers(config.guild, date.date()) | solve_writer.solvers(config.guild, date.date())
+            targets.append((config, date, problem, solved))
+    if not targets:
+        return False
+    registrations = {}
+    for user in await db.get_all_handles():
+        registrations.setdefault(user[2], []).append(user)
+    # everyone's accepted submissions go to the solve history, only users yet to solve a POTD are checked for it
+    pending = [handle for handle, users in registrations.items()
+               if any(user[0] == config.guild and user[1] not in solved for user in users
+                      for config, _, _, solved in targets)]
+    with metrics.timer('update_solvers_seconds', phase='fetch'):
+        solvers = await tracker.find_solvers(list(registrations), set((problem.id, problem.rank) for _, _, problem, _ in targets),
+                                             pending)
+    try:
+        await solved_history.record(tracker.accepted)
+    except Exception as e:
+        print(f"Error while recording accepted submissions: {e}")
+
+    new_users = 0
+    for config, date, problem, solved in targets:
+        users = [user for handle, keys in solvers.items() if (problem.id, problem.rank) in keys
+                 for user in registrations[handle] if user[0] == config.guild and user[1] not in solved]
+        if not users:
+            continue
+        new_users += len(users)
+        # saving and announcing happen in the background, so a slow Discord never holds up the next handle check
+        solve_writer.add(config.guild, date.date(), [user[1] for user in users])
     print("Solvers updated")
+    return tracker.new_submissions > 0 or new_users > 0
+
+async def solves_saved(batch):
+    for (guild, date), discord_ids in batch.items():
+        config = await db.get_guild_config(guild)
+        await emit(events.SolvesSaved(guild, config.announce_channel if config is not None else None, date, sorted(discord_ids)))
 
 
 @bot.command(name="update_potd", help="Update list of POTD solvers")
 async def update_potd(ctx):
-    await update_solvers()
+    await command(events.PollRequested())
+
+LEADERBOARDS = {
+    'streak': ("Current Streak Leaderboard", "day", Color.orange()),
+    'solves': ("Current Solves Leaderboard", "problem", Color.purple()),
+}
+
+class LeaderboardView(discord.ui.View):
+    # pages through the cached leaderboard, so clicking around never touches the database
+    def __init__(self, guild, kind, page):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.kind = kind
+        self.page = page
+        self.pages = 1
+
+    async def embed(self):
+        board = await leaderboards.get(self.guild, self.kind)
+        self.page, rows = board.page(self.page)
+        self.pages = board.pages()
+        self.previous.disabled = self.page <= 1
+        self.next.disabled = self.page >= self.pages
+        title, unit, color = LEADERBOARDS[self.kind]
+        lb_strings = [str(place) + "\U0000200D. " + entry.handle + " - " + str(entry.score) + " " + unit + ("s" if entry.score != 1 else "")
+                      for place, entry in rows]
+        embed = Embed(title=title, description=discord.utils.escape_markdown('\n'.join(lb_strings)), color=color)
+        embed.set_footer(text=f"Page {self.page}/{self.pages}")
+        return embed
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=await self.embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        self.page += 1
+        await interaction.response.edit_message(embed=await self.embed(), view=self)
+
+async def send_leaderboard(ctx, kind, page):
+    view = LeaderboardView(ctx.guild.id, kind, page)
+    embed = await view.embed()
+    await ctx.send(embed=embed, view=view if view.pages > 1 else None)
 
 @bot.command(name="streak_leaderboard", help="Show leaderboard of current streak holders")
-async def streak_leaderboard(ctx):
-    users = db.get_all_handles()
-    user_lb = []
-    for user in users:
-        streak = 0
-        for i in range(len(user) - 1, 3, -1):
-            if not user[i]:
-                if (i == len(user) - 1): continue
-                else: break
-            streak += 1
-        user_lb.append([streak, user[2]])
-    user_lb.sort()
-    user_lb.reverse()
-    curr_place = 1
-    lb_strings = []
-    for i in range(len(user_lb)):
-        if (i == 0 or user_lb[i - 1][0] != user_lb[i][0]):
-            curr_place = i + 1
-        lb_strings.append(str(curr_place) + "\U0000200D. " + user_lb[i][1] + " - " + str(user_lb[i][0]) + " day" + ("s" if user_lb[i][0] != 1 else ""))
-    await ctx.send(embed=Embed(title="Current Streak Leaderboard", description=discord.utils.escape_markdown('\n'.join(lb_strings)), color=Color.orange()))
+async def streak_leaderboard(ctx, page: int=1):
+    await send_leaderboard(ctx, 'streak', page)
 
 @bot.command(name="solves_leaderboard", help="Show leaderboard of problems solved")
-async def solves_leaderboard(ctx):
-    users = db.get_all_handles()
-    user_lb = []
-    for user in users:
-        solved = 0
-        for i in range(len(user) - 1, 3, -1):
-            solved += user[i]
-        user_lb.append([solved, user[2]])
-    user_lb.sort()
-    user_lb.reverse()
-    curr_place = 1
-    lb_strings = []
-    for i in range(len(user_lb)):
-        if (i == 0 or user_lb[i - 1][0] != user_lb[i][0]):
-            curr_place = i + 1
-        lb_strings.append(str(curr_place) + "\U0000200D. " + user_lb[i][1] + " - " + str(user_lb[i][0]) + " problem" + ("s" if user_lb[i][0] != 1 else ""))
-    await ctx.send(embed=Embed(title="Current Solves Leaderboard", description=discord.utils.escape_markdown('\n'.join(lb_strings)), color=Color.purple()))
-
-bot.run(TOKEN)
+async def solves_leaderboard(ctx, page: int=1):
+    await send_leaderboard(ctx, 'solves', page)
+
+@bot.command(name="rank", help="Show your place on the streak and solves leaderboards")
+async def rank(ctx, member: discord.Member=None):
+    if member is None:
+        member = ctx.author
+    lines = []
+    for kind in ['streak', 'solves']:
+        board = await leaderboards.get(ctx.guild.id, kind)
+        position = board.rank(member.id)
+        if position is None:
+            await ctx.send(f'Handle for {member.mention} is not set currently')
+            return
+        title, unit, _ = LEADERBOARDS[kind]
+        lines.append(f"{title}: #{position[0]} of {len(board)} with {position[1]} {unit}" + ("s" if position[1] != 1 else ""))
+    await ctx.send(embed=Embed(description=f"{member.mention}\n" + '\n'.join(lines), color=Color.blue()))
+
+@bot.command(name="rebuild_stats", help="Recompute streaks and solve counts from history (Admin/Mod/Lockout Manager only)")
+async def rebuild_stats(ctx):
+    if not has_admin_privilege(ctx):
+        await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
+        return
+    await db.rebuild_user_stats()
+    leaderboards.invalidate()
+    await ctx.send(embed=Embed(description="Stats rebuilt successfully", color=Color.green()))
+
+@bot.command(name="potd_config", help="Configure POTD for this server: announce_channel, problems_channel, admin_channel, role, difficulties (7 ratings, Monday first), timezone or theme (tags like `dp, not interactive`, `none` to clear) (Admin/Mod/Lockout Manager only)")
+async def potd_config(ctx, key: str=None, *, value: str=None):
+    if not has_admin_privilege(ctx):
+        await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
+        return
+    config = await db.get_guild_config(ctx.guild.id)
+    if config is None:
+        config = database.GuildConfig(ctx.guild.id, None, None, None, POTD_DIFFICULTIES, POTD_TIMEZONE)
+    if key is None or value is None:
+        await ctx.send(embed=Embed(title="POTD Config", description='\n'.join(
+            f"{field}: {getattr(config, field)}" for field in config._fields[1:]), color=Color.blue()))
+        return
+    try:
+        if key in ['announce_channel', 'problems_channel', 'role', 'admin_channel']:
+            config = config._replace(**{key: int(value.strip('<#@&>'))})
+        elif key == 'difficulties':
+            difficulties = [int(x) for x in value.replace(',', ' ').split()]
+            if len(difficulties) != 7:
+                raise ValueError("expected 7 ratings")
+            config = config._replace(difficulties=difficulties)
+        elif key == 'timezone':
+            potd_day(value)
+            config = config._replace(timezone=value)
+        elif key == 'theme':
+            if value.lower() == 'none':
+                config = config._replace(theme=None)
+            else:
+                if (await current_problems()).parse_query(value).rating is not None:
+                    raise ValueError("the ratings come from difficulties")
+                config = config._replace(theme=value)
+        else:
+            await ctx.send(f"Unknown setting {key}")
+            return
+    except Exception as e:
+        await ctx.send(f"Invalid value for {key}: {e}")
+        return
+    await db.set_guild_config(config)
+    await command(events.GuildConfigured(config.guild))
+    await ctx.send(embed=Embed(description=f"{key} set to {value}", color=Color.green()))
+
+@bot.command(name="preview_potd", help="Show the queued POTDs, or count the unused problems matching a query like `1400, dp, not interactive` (Admin/Mod/Lockout Manager only)")
+async def preview_potd(ctx, *, query: str=None):
+    if not has_admin_privilege(ctx):
+        await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
+        return
+    problems = await current_problems()
+    if query is None:
+        lines = [f"{date.strftime('%m/%d/%Y')}: [{name}](https://codeforces.com/contest/{id}/problem/{rank}) "
+                 f"{rating} {', '.join(problems.problem_tags(id, rank))}"
+                 for date, id, rank, name, rating in await db.get_potd_queue(ctx.guild.id)]
+        await ctx.send(embed=Embed(title="Queued POTDs", description='\n'.join(lines) or "The queue is empty", color=Color.blue()))
+        return
+    try:
+        rating, include, exclude = problems.parse_query(query)
+    except ValueError as e:
+        await ctx.send(f"Invalid query: {e}")
+        return
+    start = time.perf_counter()
+    matches = list(problems.members(problems.query(rating, include, exclude)))
+    elapsed = time.perf_counter() - start
+    lines = [f"[{x.name}](https://codeforces.com/contest/{x.id}/problem/{x.rank}) {x.rating} {', '.join(problems.problem_tags(x.id, x.rank))}"
+             for x in random.sample(matches, min(5, len(matches)))]
+    await ctx.send(embed=Embed(title=f"{len(matches)} unused problems match", description='\n'.join(lines),
+                               color=Color.blue()).set_footer(text=f"answered in {elapsed * 1e6:.0f}µs"))
+
+@bot.command(name="stats", help="Show where the bot spends its time (Admin/Mod/Lockout Manager only)")
+async def stats(ctx):
+    if not has_admin_privilege(ctx):
+        await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
+        return
+    lines = [f"{'metric':44} {'calls':>6} {'err':>4} {'total':>8} {'p50':>6} {'p99':>6}"]
+    for name, labels, calls, errors, total, p50, p99 in metrics.summary():
+        lines.append(f"{(name + ' ' + labels)[:44]:44} {calls:6d} {errors:4d} {total:8.2f} {p50:6.3g} {p99:6.3g}")
+    api = cf.stats.summary()
+    lines.append(f"codeforces: {api['requests']} requests, {api['retries']} retries, {api['throttled']} throttled, {api['errors']} errors")
+    await ctx.send(embed=Embed(title="Bot Stats", description="```\n" + '\n'.join(lines) + "\n```", color=Color.blue()))
+
+@bot.command(name="profile", help="Sample the bot's stacks for some seconds and save a flamegraph dump (Admin/Mod/Lockout Manager only)")
+async def profile(ctx, seconds: int=30):
+    if not has_admin_privilege(ctx):
+        await ctx.send(f"{ctx.author.mention} you require 'manage server' permission or the POTD Manager role to use this command")
+        return
+    if profiler.running():
+        await ctx.send("A profile is already running")
+        return
+    seconds = max(1, min(seconds, 300))
+    await ctx.send(f"Profiling for {seconds} seconds")
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    path = await asyncio.to_thread(profiler.dump)
+    top = '\n'.join(f"{count:5d} {leaf}" for leaf, count in profiler.top())
+    await ctx.send(embed=Embed(title=f"Profile ({profiler.samples} samples)", description=f"Saved to `{path}`\n```\n{top}\n```", color=Color.blue()))
+
+async def main():
+    async with bot:
+        try:
+            await bot.start(TOKEN)
+        finally:
+            if solve_writer is not None:
+                await solve_writer.flush()
+            if worker_link is not None:
+                await worker_link.close()
+            await metrics.close()
+            if cf is not None:
+                await cf.close()
+            if db is not None:
+                db.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
 
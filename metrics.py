@@ -0,0 +1,147 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from aiohttp import web
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation, good enough to tell 10ms from 1s
+        if self.count == 0:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+def label_string(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+def braces(labels):
+    return '{' + label_string(labels) + '}' if labels else ''
+
+
+class Metrics:
+    # histograms and counters keyed by name and labels, database methods observe from executor threads
+    def __init__(self, prefix='potd'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.runner = None
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name.replace('_seconds', '_errors_total'), **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), hist in histograms:
+            full = f'{self.prefix}_{name}'
+            if full not in typed:
+                typed.add(full)
+                lines.append(f'# TYPE {full} histogram')
+            seen = 0
+            for bound, count in zip(hist.buckets + (float('inf'),), hist.counts):
+                seen += count
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(f'{full}_bucket{braces(labels + (("le", le),))} {seen}')
+            lines.append(f'{full}_sum{braces(labels)} {hist.sum}')
+            lines.append(f'{full}_count{braces(labels)} {hist.count}')
+        for (name, labels), value in counters:
+            full = f'{self.prefix}_{name}'
+            if full not in typed:
+                typed.add(full)
+                lines.append(f'# TYPE {full} counter')
+            lines.append(f'{full}{braces(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, limit=15):
+        # (name, labels, calls, errors, total seconds, p50, p99) for the histograms with the most total time
+        with self.lock:
+            rows = [(name, label_string(labels), hist.count,
+                     self.counters[(name.replace('_seconds', '_errors_total'), labels)],
+                     hist.sum, hist.quantile(0.5), hist.quantile(0.99))
+                    for (name, labels), hist in self.histograms.items()]
+        rows.sort(key=lambda x: -x[4])
+        return rows[:limit]
+
+    async def handle(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def serve(self, host='127.0.0.1', port=9100):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        print(f'Serving metrics on http://{host}:{port}/metrics')
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+        self.runner = None
+
+
+metrics = Metrics()
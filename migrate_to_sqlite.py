@@ -0,0 +1,48 @@
+# Copies every table of the MySQL database into a SQLite file for database_backend=sqlite.
+#
+#   python migrate_to_sqlite.py potd.db
+#
+# The SQLite tables are emptied first, so it can be run again until the bot is switched over.
+import argparse
+import os
+
+import backends
+import database
+
+TABLES = ['handles', 'problems', 'problem_tags', 'contests', 'potds', 'potd_solves', 'user_stats', 'guild_config',
+          'handle_challenges', 'potd_queue', 'solved_problems', 'solved_history', 'submission_cursors', 'sync_state']
+
+
+def copy_table(source, target, table, batch_size=5000):
+    with source.cursor() as src, target.cursor() as dst:
+        src.execute(f"SELECT * FROM {table}")
+        columns = ', '.join(x[0] for x in src.description)
+        query = f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(src.description))})"
+        dst.execute(f"DELETE FROM {table}")
+        count = 0
+        while True:
+            rows = src.fetchmany(batch_size)
+            if not rows:
+                break
+            dst.executemany(query, rows)
+            count += len(rows)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default=os.getenv("database_path", "potd.db"))
+    parser.add_argument('--database', default='HSCSAPotd')
+    args = parser.parse_args()
+
+    # both sides go through make_tables, so the MySQL schema is migrated and the SQLite one created first
+    source = database.Database(pool_size=1, backend=backends.MySQLBackend(args.database, pool_size=1))
+    target = database.Database(backend=backends.SQLiteBackend(args.path))
+    for table in TABLES:
+        print(f"{table}: {copy_table(source, target, table)} rows")
+    source.backend.close()
+    target.backend.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from collections import deque, namedtuple
+
+Announcement = namedtuple('Announcement', 'channel date discord_ids')
+
+
+class SolveWriter:
+    # solves found by update_solvers are committed in the background, every guild's new solvers in one transaction
+    def __init__(self, db, on_commit, window=0.5, retry_delay=5):
+        self.db = db
+        self.on_commit = on_commit
+        self.window = window
+        self.retry_delay = retry_delay
+        self.pending = {}
+        self.task = None
+        self.lock = None
+
+    def add(self, guild, date, discord_ids):
+        self.pending.setdefault((guild, date), set()).update(discord_ids)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def solvers(self, guild, date):
+        # detected but not yet committed, so the next tick doesn't find them again
+        return self.pending.get((guild, date), set())
+
+    async def run(self):
+        while self.pending:
+            await asyncio.sleep(self.window)
+            if not await self.flush():
+                await asyncio.sleep(self.retry_delay)
+
+    async def flush(self):
+        # shutdown flushes while run may be in the middle of its own flush, the same solves mustn't be saved twice
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            return await self.save()
+
+    async def save(self):
+        batch = {key: set(ids) for key, ids in self.pending.items()}
+        if not batch:
+            return True
+        try:
+            await self.db.add_solves([(guild, date, sorted(ids)) for (guild, date), ids in batch.items()])
+        except Exception as e:
+            print(f"Error while saving solves, will retry: {e}")
+            return False
+        for key, ids in batch.items():
+            self.pending[key] -= ids
+            if not self.pending[key]:
+                del self.pending[key]
+        try:
+            await self.on_commit(batch)
+        except Exception as e:
+            print(f"Error after saving solves: {e}")
+        return True
+
+
+class Announcer:
+    # posts solve announcements off the detection path. Solvers queued for the same channel within window
+    # seconds share a message, and publishing stays inside Discord's limit of 10 crossposts per channel per hour
+    def __init__(self, bot, reaction=None, window=2, max_mentions=20, publish_limit=10, publish_period=60 * 60):
+        self.bot = bot
+        self.reaction = reaction
+        self.window = window
+        self.max_mentions = max_mentions
+        self.publish_limit = publish_limit
+        self.publish_period = publish_period
+        self.published = {}
+        self.queue = None
+        self.task = None
+
+    def announce(self, channel, date, discord_ids):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.queue.put_nowait(Announcement(channel, date, list(discord_ids)))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.window)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            groups = {}
+            for x in batch:
+                groups.setdefault((x.channel, x.date), []).extend(x.discord_ids)
+            for (channel, date), discord_ids in groups.items():
+                for i in range(0, len(discord_ids), self.max_mentions):
+                    try:
+                        await self.send(channel, date, discord_ids[i:i + self.max_mentions])
+                    except Exception as e:
+                        print(f"Error while announcing solvers in {channel}: {e}")
+
+    def can_publish(self, channel):
+        sent = self.published.setdefault(channel, deque())
+        now = time.monotonic()
+        while sent and sent[0] < now - self.publish_period:
+            sent.popleft()
+        if len(sent) >= self.publish_limit:
+            return False
+        sent.append(now)
+        return True
+
+    async def send(self, channel, date, discord_ids):
+        mentions = [f"<@{x}>" for x in discord_ids]
+        names = mentions[0] if len(mentions) == 1 else ', '.join(mentions[:-1]) + ' and ' + mentions[-1]
+        msg = await self.bot.get_channel(channel).send(f"Congratulations to {names} for solving POTD {date}!")
+        if self.can_publish(channel):
+            await msg.publish()
+        if self.reaction:
+            await msg.add_reaction(self.reaction)
@@ -0,0 +1,215 @@
+import math
+import random
+
+from collections import namedtuple
+
+from solved_index import popcount
+
+Problem = namedtuple('Problem', 'id rank name type rating used')
+TagQuery = namedtuple('TagQuery', 'rating include exclude')
+
+
+class RatingBucket:
+    # fenwick tree over the selection weights, used problems keep their slot with weight 0
+    def __init__(self):
+        self.problems = []
+        self.weights = []
+        self.tree = [0]
+        self.available = 0
+
+    def prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def append(self, problem, weight):
+        self.problems.append(problem)
+        self.weights.append(weight)
+        n = len(self.problems)
+        self.tree.append(weight + self.prefix(n - 1) - self.prefix(n - (n & -n)))
+        if weight:
+            self.available += 1
+        return n - 1
+
+    def update(self, i, weight):
+        delta = weight - self.weights[i]
+        if self.weights[i] and not weight:
+            self.available -= 1
+        elif weight and not self.weights[i]:
+            self.available += 1
+        self.weights[i] = weight
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def sample(self):
+        total = self.prefix(len(self.problems))
+        if total <= 0:
+            return None
+        target = random.randrange(total)
+        pos, step = 0, 1 << (len(self.problems).bit_length())
+        while step:
+            if pos + step < len(self.tree) and self.tree[pos + step] <= target:
+                pos += step
+                target -= self.tree[pos]
+            step >>= 1
+        return self.problems[pos]
+
+    def sample_weighted(self, weight):
+        # the usual weights scaled by weight(problem), computed over every available problem of the bucket
+        candidates = [(problem, w * weight(problem)) for problem, w in zip(self.problems, self.weights) if w]
+        if sum(w for _, w in candidates) <= 0:
+            return self.sample()
+        return random.choices([x[0] for x in candidates], weights=[x[1] for x in candidates])[0]
+
+
+class ProblemIndex:
+    def __init__(self, problems=(), tags=()):
+        self.buckets = {}
+        # (id, rank) -> (rating, slot in the bucket, bit)
+        self.positions = {}
+        # every problem gets one bit, tags and ratings are bitsets over them held in python ints, so a query
+        # like "1400, dp, not interactive" is a few ANDs over a couple of kilobytes
+        self.problems = []
+        self.tags = {}
+        self.ratings = {}
+        self.available = 0
+        for problem in problems:
+            self.add(*problem)
+        for id, rank, tag in tags:
+            self.add_tags(id, rank, [tag])
+
+    @staticmethod
+    def weight(problem):
+        return max(1, int(problem.id * math.sqrt(problem.id)))
+
+    def add(self, id, rank, name, type, rating, used):
+        if (id, rank) in self.positions:
+            return
+        problem = Problem(id, rank, name, type, rating, used)
+        bucket = self.buckets.setdefault(rating, RatingBucket())
+        i = bucket.append(problem, 0 if used else self.weight(problem))
+        bit = len(self.problems)
+        self.problems.append(problem)
+        self.ratings[rating] = self.ratings.get(rating, 0) | 1 << bit
+        if not used:
+            self.available |= 1 << bit
+        self.positions[(id, rank)] = (rating, i, bit)
+
+    def add_tags(self, id, rank, tags):
+        if (id, rank) not in self.positions:
+            return
+        bit = self.positions[(id, rank)][2]
+        for tag in tags:
+            self.tags[tag] = self.tags.get(tag, 0) | 1 << bit
+
+    def remove(self, id, rank):
+        if (id, rank) not in self.positions:
+            return
+        rating, i, bit = self.positions[(id, rank)]
+        self.buckets[rating].update(i, 0)
+        self.available &= ~(1 << bit)
+
+    def restore(self, id, rank):
+        if (id, rank) not in self.positions:
+            return
+        rating, i, bit = self.positions[(id, rank)]
+        bucket = self.buckets[rating]
+        bucket.update(i, self.weight(bucket.problems[i]))
+        self.available |= 1 << bit
+
+    def tagged(self):
+        tagged = 0
+        for bits in self.tags.values():
+            tagged |= bits
+        return set((x.id, x.rank) for x in self.members(tagged))
+
+    def problem_tags(self, id, rank):
+        if (id, rank) not in self.positions:
+            return []
+        bit = self.positions[(id, rank)][2]
+        return sorted(tag for tag, bits in self.tags.items() if bits >> bit & 1)
+
+    def parse_query(self, text):
+        # "1400, dp and not interactive": a rating, tags to have and tags to avoid, separated by commas or "and"
+        rating, include, exclude = None, [], []
+        for part in text.lower().split(','):
+            for word in self.split_and(part):
+                word = word.strip()
+                if not word:
+                    continue
+                if word.isdigit():
+                    rating = int(word)
+                    continue
+                target = include
+                if word.startswith('not ') or word.startswith('-'):
+                    word = word.removeprefix('not ').removeprefix('-').strip()
+                    target = exclude
+                if word not in self.tags:
+                    raise ValueError(f"unknown tag {word}")
+                target.append(word)
+        return TagQuery(rating, include, exclude)
+
+    def split_and(self, part):
+        # some tags contain "and" themselves, e.g. "divide and conquer", so the longest run of pieces that makes
+        # a known tag is kept together
+        pieces = part.split(' and ')
+        words = []
+        i = 0
+        while i < len(pieces):
+            j = next((j for j in range(len(pieces), i + 1, -1)
+                      if ' and '.join(pieces[i:j]).strip().removeprefix('not ').removeprefix('-').strip() in self.tags),
+                     i + 1)
+            words.append(' and '.join(pieces[i:j]))
+            i = j
+        return words
+
+    def query(self, rating=None, include=(), exclude=(), available=True):
+        mask = self.ratings.get(rating, 0) if rating is not None else (1 << len(self.problems)) - 1
+        if available:
+            mask &= self.available
+        for tag in include:
+            mask &= self.tags.get(tag, 0)
+        for tag in exclude:
+            mask &= ~self.tags.get(tag, 0)
+        return mask
+
+    def members(self, mask):
+        while mask:
+            low = mask & -mask
+            yield self.problems[low.bit_length() - 1]
+            mask ^= low
+
+    def matches(self, id, rank, include=(), exclude=()):
+        if (id, rank) not in self.positions:
+            return False
+        bit = self.positions[(id, rank)][2]
+        return bool(self.query(None, include, exclude, available=False) >> bit & 1)
+
+    def sample(self, rating, weight=None, include=(), exclude=()):
+        if rating not in self.buckets:
+            return None
+        if include or exclude:
+            return self.sample_tagged(rating, weight, include, exclude)
+        if weight is not None:
+            return self.buckets[rating].sample_weighted(weight)
+        return self.buckets[rating].sample()
+
+    def sample_tagged(self, rating, weight, include, exclude):
+        candidates = list(self.members(self.query(rating, include, exclude)))
+        if not candidates:
+            return None
+        weights = [self.weight(x) * (weight(x) if weight is not None else 1) for x in candidates]
+        if sum(weights) <= 0:
+            weights = [self.weight(x) for x in candidates]
+        return random.choices(candidates, weights=weights)[0]
+
+    def count(self, rating, include=(), exclude=()):
+        if include or exclude:
+            return popcount(self.query(rating, include, exclude))
+        if rating not in self.buckets:
+            return 0
+        return self.buckets[rating].available
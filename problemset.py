@@ -0,0 +1,35 @@
+def isNonStandard(contest_name):
+    names = [
+        'wild', 'fools', 'unrated', 'surprise', 'unknown', 'friday', 'q#', 'testing',
+        'marathon', 'kotlin', 'onsite', 'experimental', 'abbyy']
+    for x in names:
+        if x in contest_name.lower():
+            return True
+    return False
+
+def diff_problemset(contest_list, problem_list, contest_id, problem_keys, problem_names, tagged=()):
+    # contest_list and problem_list are iterables of cf_api records, consumed one item at a time
+    mapping = {}
+    new_contests, new_problems, new_tags = [], [], []
+
+    for contest in contest_list:
+        if isNonStandard(contest.name):
+            continue
+        mapping[contest.id] = True
+        if contest.id not in contest_id and contest.phase == "FINISHED":
+            new_contests.append((contest.id, contest.name.encode('ascii','replace').decode("ascii")))
+
+    for problem in problem_list:
+        if problem.contest_id not in mapping or problem.rating is None:
+            continue
+        problemName = problem.name.encode('ascii','replace').decode("ascii");
+        # names are still checked so problems shared between div. 1 and div. 2 are only added once
+        if (problem.contest_id, problem.index) not in problem_keys and problemName not in problem_names:
+            problem_keys.add((problem.contest_id, problem.index))
+            problem_names.add(problemName)
+            new_problems.append((problem.contest_id, problem.index, problemName, problem.type, problem.rating, False))
+        # tags of known problems that have none stored yet, which backfills problems added before tags were kept
+        if (problem.contest_id, problem.index) in problem_keys and (problem.contest_id, problem.index) not in tagged:
+            new_tags += [(problem.contest_id, problem.index, tag) for tag in problem.tags]
+
+    return new_contests, new_problems, new_tags
@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    # samples the stacks of every thread on a timer and writes them in collapsed "a;b;c count" form,
+    # which flamegraph.pl and speedscope read directly
+    def __init__(self, interval=0.005, directory=None):
+        self.interval = interval
+        self.directory = directory or os.getenv("profile_dir", "profiles")
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def sample(self):
+        names = {x.ident: x.name for x in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == threading.get_ident():
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def running(self):
+        return self.thread is not None
+
+    def top(self, limit=10):
+        # functions most often found on top of a stack, skipping threads parked waiting for work
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            if not leaf.startswith(('wait (', 'select (', 'get (')):
+                leaves[leaf] += count
+        return leaves.most_common(limit)
+
+    def dump(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S.txt'))
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
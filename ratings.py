@@ -0,0 +1,45 @@
+import asyncio
+
+
+class RatingSync:
+    # keeps rating, rank and avatar of every registered handle current, so commands can answer from the database
+    def __init__(self, db, cf, chunk_size=300):
+        self.db = db
+        self.cf = cf
+        # lookups started together are coalesced by the client into user.info calls of up to its batch_size
+        self.chunk_size = chunk_size
+        # lower-cased handles already reported missing, each is only returned by the first sync that sees it gone
+        self.missing = set()
+
+    async def sync(self):
+        # returns (old, new) pairs of renamed handles and the handles Codeforces newly stopped knowing
+        profiles = {}
+        for handle, rating, rank, photo in await self.db.get_handle_profiles():
+            profiles.setdefault(handle, set()).add((rating, rank, photo))
+        handles = list(profiles)
+        renamed, missing = [], []
+        for i in range(0, len(handles), self.chunk_size):
+            chunk = handles[i:i + self.chunk_size]
+            # get_user rather than get_user_info, the error comment tells a deleted handle from a failed request
+            results = await asyncio.gather(*[self.cf.get_user(handle, fresh=True) for handle in chunk])
+            rows = []
+            for handle, data in zip(chunk, results):
+                if not data[0]:
+                    if "not found" in data[1] and handle.lower() not in self.missing:
+                        self.missing.add(handle.lower())
+                        missing.append(handle)
+                    continue
+                self.missing.discard(handle.lower())
+                info = data[1]
+                profile = (info.get('rating', 0), info.get('rank', 'unrated'), info.get('titlePhoto'))
+                # user.info answers an old handle with the profile under its new one
+                if info['handle'] != handle:
+                    await self.db.rename_handle(handle, info['handle'])
+                    renamed.append((handle, info['handle']))
+                elif profiles[handle] == {profile}:
+                    continue
+                rows.append((*profile, info['handle']))
+            if rows:
+                await self.db.update_handle_profiles(rows)
+        print(f"Synced {len(handles)} handles, {len(renamed)} renamed and {len(missing)} missing")
+        return renamed, missing
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from metrics import metrics
+
+# a guild's POTD day starts at midnight in its timezone, everything that needs "today's" POTD goes through potd_day
+def potd_day(timezone):
+    return datetime.now(ZoneInfo(timezone)).replace(tzinfo=None)
+
+
+class PotdScheduler:
+    def __init__(self, rollover, poll, fast_interval=60, slow_interval=600):
+        self.scheduler = AsyncIOScheduler()
+        self.rollover = rollover
+        self.poll = poll
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.interval = fast_interval
+
+    def add_guild(self, guild, timezone):
+        self.scheduler.add_job(self.run_rollover, CronTrigger(hour=0, minute=0, timezone=timezone), args=[guild],
+                               id=f'rollover-{guild}', replace_existing=True, misfire_grace_time=60 * 60, coalesce=True)
+
+    async def start(self, guilds):
+        for guild, timezone in guilds:
+            self.add_guild(guild, timezone)
+        self.scheduler.start()
+        # catch up on rollovers missed while the bot was down, rollover is a no-op if today's POTD exists
+        for guild, _ in guilds:
+            await self.run_rollover(guild)
+
+    def schedule_poll(self, delay):
+        self.scheduler.add_job(self.run_poll, 'date', run_date=datetime.now() + timedelta(seconds=delay),
+                               id='poll', replace_existing=True, misfire_grace_time=60)
+
+    async def run_rollover(self, guild):
+        try:
+            with metrics.timer('job_seconds', job='rollover'):
+                await self.rollover(guild)
+        except Exception as e:
+            print(f"Error while rolling over POTD for guild {guild}: {e}")
+        self.interval = self.fast_interval
+        self.schedule_poll(0)
+
+    async def run_poll(self):
+        try:
+            with metrics.timer('job_seconds', job='poll'):
+                active = await self.poll()
+        except Exception as e:
+            print(f"Error while polling solvers: {e}")
+            active = False
+        # poll every minute while people are submitting, back off to slow_interval when it's quiet
+        if active:
+            self.interval = self.fast_interval
+        else:
+            self.interval = min(self.slow_interval, self.interval * 2)
+        self.schedule_poll(self.interval)
+
+    def add_job(self, func, *args, **kwargs):
+        return self.scheduler.add_job(metrics.timed('job_seconds', job=func.__name__)(func), *args, **kwargs)
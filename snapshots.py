@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+import time
+
+
+class SnapshotWriter:
+    # streams raw bytes into a temporary gzip file that only replaces the snapshot once committed
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.tmp = store.path(name, '.json.gz.tmp')
+        os.makedirs(store.directory, exist_ok=True)
+        self.file = gzip.open(self.tmp, 'wb', compresslevel=6)
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self, digest):
+        self.file.close()
+        os.replace(self.tmp, self.store.path(self.name, '.json.gz'))
+        self.store.touch(self.name, digest)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+class SnapshotStore:
+    # gzipped copies of large API responses, with when they were fetched and the hash of the response
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("snapshot_dir", "snapshots")
+
+    def path(self, name, suffix):
+        return os.path.join(self.directory, name + suffix)
+
+    def meta(self, name):
+        try:
+            with open(self.path(name, '.meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def exists(self, name):
+        return self.meta(name) is not None and os.path.exists(self.path(name, '.json.gz'))
+
+    def chunks(self, name, chunk_size=1 << 16):
+        with gzip.open(self.path(name, '.json.gz'), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def writer(self, name):
+        return SnapshotWriter(self, name)
+
+    def touch(self, name, digest):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path(name, '.meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'fetched_at': time.time(), 'hash': digest}, f)
+        os.replace(tmp, self.path(name, '.meta.json'))
+
+    def age(self, name):
+        meta = self.meta(name)
+        if meta is None:
+            return None
+        return time.time() - meta['fetched_at']
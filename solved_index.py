@@ -0,0 +1,85 @@
+popcount = getattr(int, 'bit_count', lambda x: bin(x).count('1'))
+
+
+class SolvedIndex:
+    # problem -> bitset of the handles that solved it, one bit per handle, held in a python int
+    def __init__(self):
+        self.positions = {}
+        self.bits = {}
+        self.masks = {}
+        # handles whose whole history has been loaded
+        self.synced = set()
+
+    def position(self, handle):
+        key = handle.lower()
+        if key not in self.positions:
+            self.positions[key] = len(self.positions)
+        return self.positions[key]
+
+    def add(self, handle, problems):
+        bit = 1 << self.position(handle)
+        for key in problems:
+            self.bits[key] = self.bits.get(key, 0) | bit
+
+    def rename(self, old, new):
+        # the bit stays with the member, so nothing is fetched again for a renamed handle
+        if old.lower() in self.positions and new.lower() not in self.positions:
+            self.positions[new.lower()] = self.positions.pop(old.lower())
+            if old.lower() in self.synced:
+                self.synced.discard(old.lower())
+                self.synced.add(new.lower())
+
+    def set_members(self, guild, handles):
+        mask = 0
+        for handle in handles:
+            mask |= 1 << self.position(handle)
+        self.masks[guild] = mask
+
+    def penalty(self, guild, power=2):
+        # selection weight multiplier for a guild, a problem most of its members solved is rarely picked
+        mask = self.masks.get(guild, 0)
+        members = popcount(mask)
+
+        def weight(problem):
+            if not members:
+                return 1
+            return (1 - popcount(self.bits.get((problem.id, problem.rank), 0) & mask) / members) ** power
+        return weight
+
+
+class SolvedHistory:
+    # fills a SolvedIndex from each registered handle's full user.status history, once per handle, and keeps
+    # it current with the accepted submissions the solver tracker sees every tick
+    def __init__(self, db, cf, index):
+        self.db = db
+        self.cf = cf
+        self.index = index
+
+    async def load(self):
+        for handle, id, rank in await self.db.get_solved_problems():
+            self.index.add(handle, [(id, rank)])
+        self.index.synced.update(x.lower() for x in await self.db.get_synced_histories())
+
+    async def sync(self):
+        guilds = {}
+        for guild, _, handle, _ in await self.db.get_all_handles():
+            guilds.setdefault(guild, []).append(handle)
+        for guild, handles in guilds.items():
+            self.index.set_members(guild, handles)
+        for handle in set(x for handles in guilds.values() for x in handles):
+            if handle.lower() in self.index.synced:
+                continue
+            solved = await self.cf.get_solved_problems(handle)
+            if solved is None:
+                continue
+            await self.db.add_solved_problems([(handle, *x) for x in solved], synced=[handle])
+            self.index.add(handle, solved)
+            self.index.synced.add(handle.lower())
+
+    async def record(self, accepted):
+        # (handle, (contestId, index)) pairs
+        if not accepted:
+            return
+        for handle, key in accepted:
+            self.index.add(handle, [key])
+        await self.db.add_solved_problems([(handle, *key) for handle, key in accepted])
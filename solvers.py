@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+# verdicts of submissions that are still being judged
+JUDGING = (None, 'TESTING')
+
+
+class SolverTracker:
+    def __init__(self, cf, db=None, mode='recent', recent_count=1000, concurrency=4, page_size=50, first_page=5,
+                 max_page=100, max_pages=5):
+        self.cf = cf
+        self.db = db
+        # 'recent' reads the site-wide problemset.recentStatus feed once per tick, 'status' asks user.status per handle
+        self.mode = mode
+        self.recent_count = recent_count
+        self.recent_cursor = None
+        self.saved_cursor = None
+        # handles with a POTD submission still being judged, looked at with user.status on the next tick
+        self.recheck = set()
+        # handles check_solved left a POTD submission still being judged for during the current tick
+        self.judging = set()
+        self.concurrency = concurrency
+        # a handle seen for the first time gets one page of page_size, known handles start with first_page
+        # submissions and double the page until the cursor is reached
+        self.page_size = page_size
+        self.first_page = first_page
+        self.max_page = max_page
+        self.max_pages = max_pages
+        # newest submission id seen per handle, so later ticks only look at new activity
+        self.last_seen = {}
+        self.changed = {}
+        # submissions newer than the high-water marks seen during the last find_solvers call
+        self.new_submissions = 0
+        # (handle, (contestId, index)) of every accepted submission seen during the last find_solvers call
+        self.accepted = []
+
+    async def load(self):
+        if self.db is not None:
+            self.last_seen.update(await self.db.get_submission_cursors())
+            cursor = await self.db.get_sync_state('recent_status_cursor')
+            self.recent_cursor = self.saved_cursor = int(cursor) if cursor else None
+
+    async def save(self):
+        if self.db is None:
+            return
+        changed, self.changed = self.changed, {}
+        try:
+            if changed:
+                await self.db.set_submission_cursors(changed)
+            if self.recent_cursor != self.saved_cursor:
+                await self.db.set_sync_state({'recent_status_cursor': str(self.recent_cursor)})
+                self.saved_cursor = self.recent_cursor
+        except Exception as e:
+            print(f"Error while saving submission cursors: {e}")
+            self.changed = {**changed, **self.changed}
+
+    async def check_solved(self, handle, problems, semaphore):
+        last = self.last_seen.get(handle, 0)
+        newest = last
+        solved = set()
+        start = 1
+        count = self.first_page if last else self.page_size
+        judging = None
+        for _ in range(self.max_pages):
+            async with semaphore:
+                subs = await self.cf.get_user_problems(handle, count, start)
+            if not subs[0]:
+                return solved
+            reached = False
+            for x in subs[1]:
+                if x.sub_id <= last:
+                    reached = True
+                    break
+                newest = max(newest, x.sub_id)
+                self.new_submissions += 1
+                if x.verdict == 'OK' and x.id is not None:
+                    self.accepted.append((handle, (x.id, x.index)))
+                if x.verdict == 'OK' and (x.id, x.index) in problems:
+                    solved.add((x.id, x.index))
+                elif x.verdict in JUDGING and (x.id, x.index) in problems:
+                    judging = x.sub_id
+            if reached or len(subs[1]) < count or last == 0:
+                break
+            start += count
+            count = min(self.max_page, count * 2)
+        # the cursor stays below a POTD submission that is still being judged so the next tick sees its verdict
+        if judging is not None:
+            self.judging.add(handle)
+            newest = max(last, min(newest, judging - 1))
+        if newest != last:
+            self.last_seen[handle] = newest
+            self.changed[handle] = newest
+        return solved
+
+    async def find_solvers(self, handles, problems, pending=None):
+        # each handle is fetched once per tick, whatever number of guilds and POTDs it's checked against.
+        # Only pending handles, by default all of them, are checked for problems, the feed still records what
+        # every handle got accepted
+        pending = handles if pending is None else pending
+        start_time = time.perf_counter()
+        start_requests = self.cf.stats.requests
+        self.new_submissions = 0
+        self.accepted = []
+        self.judging = set()
+        if self.mode == 'recent':
+            solvers = await self.find_recent(handles, problems, pending)
+            # the feed cursor has moved past those submissions, only user.status will see their verdicts
+            self.recheck |= self.judging
+        else:
+            solvers = await self.check_handles(pending, problems)
+        await self.save()
+        print(f"Checked {len(handles)} handles in {time.perf_counter() - start_time:.2f}s "
+              f"with {self.cf.stats.requests - start_requests} requests")
+        return solvers
+
+    async def check_handles(self, handles, problems):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self.check_solved(handle, problems, semaphore) for handle in handles])
+        return {handle: solved for handle, solved in zip(handles, results) if solved}
+
+    async def find_recent(self, handles, problems, pending):
+        feed = await self.cf.get_recent_status(self.recent_count)
+        if not feed[0] or not feed[1]:
+            return await self.check_handles(pending, problems)
+        cursor = self.recent_cursor
+        self.recent_cursor = max([x.sub_id for x, _ in feed[1]] + [cursor or 0])
+        # on the first tick, or when more was submitted since the last one than the feed holds, there may be a
+        # gap between the cursor and the feed, and only asking every pending handle is sure to cover it
+        if cursor is None or min(x.sub_id for x, _ in feed[1]) > cursor:
+            return await self.check_handles(pending, problems)
+
+        registered = {handle.lower(): handle for handle in handles}
+        waiting = set(handle.lower() for handle in pending)
+        recheck, self.recheck = set(x for x in self.recheck if x.lower() in waiting), set()
+        solvers = {}
+        newest = {}
+        for x, authors in feed[1]:
+            if x.sub_id <= cursor:
+                continue
+            for author in authors:
+                handle = registered.get(author.lower())
+                if handle is None:
+                    continue
+                self.new_submissions += 1
+                newest[handle] = max(newest.get(handle, 0), x.sub_id)
+                if x.verdict == 'OK' and x.id is not None:
+                    self.accepted.append((handle, (x.id, x.index)))
+                if (x.id, x.index) not in problems or handle.lower() not in waiting:
+                    continue
+                if x.verdict == 'OK':
+                    solvers.setdefault(handle, set()).add((x.id, x.index))
+                elif x.verdict in JUDGING:
+                    self.recheck.add(handle)
+        # the feed covered everything since the cursor, so per-handle cursors can move up too
+        for handle, sub_id in newest.items():
+            if handle not in self.recheck and sub_id > self.last_seen.get(handle, 0):
+                self.last_seen[handle] = self.changed[handle] = sub_id
+        recheck = [x for x in recheck if x not in solvers]
+        if recheck:
+            for handle, solved in (await self.check_handles(recheck, problems)).items():
+                solvers.setdefault(handle, set()).update(solved)
+        return solvers
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from cf_api import CodeforcesAPI, RateLimiter
+from fake_codeforces import FakeCodeforces
+
+
+async def run(fake_cf, clients, calls):
+    url = await fake_cf.start()
+    for cf in clients:
+        cf.base_url = url
+    try:
+        return await asyncio.gather(*[clients[i % len(clients)].get_user_problems(f'user{i}', 5)
+                                      for i in range(calls)])
+    finally:
+        for cf in clients:
+            await cf.close()
+        await fake_cf.stop()
+
+
+def test_503_responses_are_retried_with_backoff():
+    fake_cf = FakeCodeforces(failure_rate=0.5, seed=1)
+    cf = CodeforcesAPI(limiter=RateLimiter(rate=1000, burst=1000), max_tries=20, backoff_base=0.001)
+    results = asyncio.run(run(fake_cf, [cf], 20))
+    assert all(x[0] for x in results)
+    assert fake_cf.failures > 0
+    assert cf.stats.retries == fake_cf.failures
+    assert cf.stats.requests == fake_cf.total_calls() == 20 + fake_cf.failures
+    assert cf.stats.errors == 0
+
+
+def test_clients_sharing_a_limiter_keep_its_spacing():
+    rate = 20
+    limiter = RateLimiter(rate=rate, burst=1)
+    clients = [CodeforcesAPI(limiter=limiter, backoff_base=0.001) for _ in range(3)]
+    fake_cf = FakeCodeforces(failure_rate=0.2, seed=2)
+    results = asyncio.run(run(fake_cf, clients, 12))
+    assert all(x[0] for x in results)
+    requests = sum(cf.stats.requests for cf in clients)
+    assert requests == fake_cf.total_calls()
+    # only the first request finds a token in the bucket, every later one waits for the next
+    assert sum(cf.stats.throttled for cf in clients) == requests - 1
+    # any k later requests arrive at least k / rate after an earlier one, give or take one late arrival
+    times = fake_cf.times
+    assert all(times[j] - times[i] > (j - i) / rate - 0.03 for i in range(len(times)) for j in range(i + 1, len(times)))
@@ -0,0 +1,27 @@
+import pytest
+
+from problem_index import ProblemIndex, TagQuery
+
+TAGS = ['dp', 'greedy', 'divide and conquer', 'interactive']
+
+
+@pytest.fixture
+def index():
+    return ProblemIndex([(1, 'A', 'P1', 'PROGRAMMING', 1400, False)], [(1, 'A', tag) for tag in TAGS])
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1400, dp and not interactive', TagQuery(1400, ['dp'], ['interactive'])),
+    ('divide and conquer', TagQuery(None, ['divide and conquer'], [])),
+    ('not divide and conquer', TagQuery(None, [], ['divide and conquer'])),
+    ('1400, dp and not divide and conquer', TagQuery(1400, ['dp'], ['divide and conquer'])),
+    ('divide and conquer and greedy', TagQuery(None, ['divide and conquer', 'greedy'], [])),
+    ('dp and -divide and conquer and not interactive', TagQuery(None, ['dp'], ['divide and conquer', 'interactive'])),
+])
+def test_parse_query(index, text, expected):
+    assert index.parse_query(text) == expected
+
+
+def test_parse_query_unknown_tag(index):
+    with pytest.raises(ValueError, match='unknown tag divide'):
+        index.parse_query('dp and divide')
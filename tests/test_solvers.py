@@ -0,0 +1,74 @@
+import asyncio
+
+from cf_api import Submission
+from solvers import SolverTracker
+
+POTD = (1, 'A')
+
+
+class Stats:
+    requests = 0
+
+
+class FakeCodeforces:
+    # problemset.recentStatus and user.status over one shared list of submissions, newest first
+    def __init__(self):
+        self.stats = Stats()
+        self.submissions = []
+
+    def submit(self, handle, sub_id, verdict, problem=POTD):
+        self.submissions.insert(0, (Submission(problem[0], problem[1], 'Problem', 'PROGRAMMING', 800, 0, verdict, sub_id), [handle]))
+
+    def judge(self, sub_id, verdict):
+        for x, _ in self.submissions:
+            if x.sub_id == sub_id:
+                x.verdict = verdict
+
+    async def get_recent_status(self, count=1000):
+        return [True, self.submissions[:count]]
+
+    async def get_user_problems(self, handle, count=None, start=1):
+        subs = [x for x, authors in self.submissions if handle in authors]
+        return [True, subs[start - 1:start - 1 + count] if count else subs]
+
+
+def test_judging_submission_is_rechecked_until_it_has_a_verdict():
+    cf = FakeCodeforces()
+    tracker = SolverTracker(cf)
+    cf.submit('stranger', 10, 'WRONG_ANSWER')
+
+    async def tick():
+        return await tracker.find_solvers(['alice'], {POTD})
+
+    assert asyncio.run(tick()) == {}
+    cf.submit('alice', 20, 'TESTING')
+    assert asyncio.run(tick()) == {}
+    # still judging when the handle is looked at with user.status
+    assert asyncio.run(tick()) == {}
+    cf.judge(20, 'OK')
+    assert asyncio.run(tick()) == {'alice': {POTD}}
+    assert asyncio.run(tick()) == {}
+
+
+def test_accepted_submission_in_feed_is_found_once():
+    cf = FakeCodeforces()
+    tracker = SolverTracker(cf)
+    cf.submit('stranger', 10, 'WRONG_ANSWER')
+    asyncio.run(tracker.find_solvers(['alice'], {POTD}))
+    cf.submit('alice', 20, 'OK')
+    assert asyncio.run(tracker.find_solvers(['alice'], {POTD})) == {'alice': {POTD}}
+    assert asyncio.run(tracker.find_solvers(['alice'], {POTD})) == {}
+
+
+def test_accepted_submissions_of_credited_users_are_recorded():
+    cf = FakeCodeforces()
+    tracker = SolverTracker(cf)
+    cf.submit('stranger', 10, 'WRONG_ANSWER')
+    asyncio.run(tracker.find_solvers(['alice', 'bob'], {POTD}))
+    cf.submit('alice', 20, 'OK')
+    assert asyncio.run(tracker.find_solvers(['alice', 'bob'], {POTD})) == {'alice': {POTD}}
+    # alice is credited for today, only bob is still checked for the POTD
+    cf.submit('alice', 30, 'OK', problem=(99, 'B'))
+    cf.submit('alice', 31, 'OK')
+    assert asyncio.run(tracker.find_solvers(['alice', 'bob'], {POTD}, ['bob'])) == {}
+    assert tracker.accepted == [('alice', POTD), ('alice', (99, 'B'))]
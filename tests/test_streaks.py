@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+import database
+
+GUILD = 1
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('database_backend', 'sqlite')
+    monkeypatch.setenv('database_path', str(tmp_path / 'potd.db'))
+    db = database.Database()
+    db.add_handle(GUILD, 10, 'tourist', 3800)
+    yield db
+    db.backend.close()
+
+
+def stats(db):
+    with db.cursor() as curr:
+        curr.execute("SELECT current_streak, longest_streak, total_solves FROM user_stats WHERE discord_id = 10")
+        return tuple(curr.fetchone())
+
+
+def test_late_solve_after_rollover(db):
+    db.add_potd(GUILD, date(2024, 1, 1), 1, 'A', 'P1')
+    db.add_solves([(GUILD, date(2024, 1, 1), [10])])
+    db.add_potd(GUILD, date(2024, 1, 2), 2, 'A', 'P2')
+    db.add_solves([(GUILD, date(2024, 1, 2), [10])])
+    db.add_potd(GUILD, date(2024, 1, 3), 3, 'A', 'P3')
+    db.add_potd(GUILD, date(2024, 1, 4), 4, 'A', 'P4')
+    # the day 3 solve is only saved after day 4 went out
+    db.add_solves([(GUILD, date(2024, 1, 3), [10])])
+    assert stats(db) == (3, 3, 3)
+    db.rebuild_user_stats()
+    assert stats(db) == (3, 3, 3)
+
+
+def test_solves_in_order(db):
+    for day in range(1, 4):
+        db.add_potd(GUILD, date(2024, 1, day), day, 'A', f'P{day}')
+        db.add_solves([(GUILD, date(2024, 1, day), [10])])
+    assert stats(db) == (3, 3, 3)
+    db.add_potd(GUILD, date(2024, 1, 4), 4, 'A', 'P4')
+    db.add_potd(GUILD, date(2024, 1, 5), 5, 'A', 'P5')
+    assert stats(db) == (0, 3, 3)
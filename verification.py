@@ -0,0 +1,68 @@
+import asyncio
+import random
+import string
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+Challenge = namedtuple('Challenge', 'guild discord_id handle token channel expires_at')
+
+
+class HandleVerifier:
+    # pending "set your first name to X" challenges live in handle_challenges, and while any are pending
+    # they're all checked together with one user.info request every interval seconds
+    def __init__(self, db, cf, on_verified, on_expired, interval=5, timeout=300):
+        self.db = db
+        self.cf = cf
+        self.on_verified = on_verified
+        self.on_expired = on_expired
+        self.interval = interval
+        self.timeout = timeout
+        self.task = None
+        self.woken = False
+
+    async def challenge(self, guild, discord_id, handle, channel):
+        token = ''.join(random.choices(string.ascii_uppercase + string.digits, k=15))
+        await self.db.add_challenge(guild, discord_id, handle, token, channel,
+                                    datetime.now() + timedelta(seconds=self.timeout))
+        self.start()
+        return token
+
+    def start(self):
+        self.woken = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.woken = False
+            try:
+                pending = await self.poll()
+            except Exception as e:
+                print(f"Error while verifying handles: {e}")
+                pending = True
+            # a challenge added while poll was running keeps the loop alive even if poll missed it
+            if not pending and not self.woken:
+                return
+
+    async def poll(self):
+        challenges = [Challenge(*x) for x in await self.db.get_challenges()]
+        now = datetime.now()
+        expired = [x for x in challenges if x.expires_at <= now]
+        live = [x for x in challenges if x.expires_at > now]
+        infos = await self.cf.get_user_info([x.handle for x in live], fresh=True) if live else []
+        verified = [(x, info) for x, info in zip(live, infos) if info is not None and info.get('firstName') == x.token]
+        done = expired + [x for x, _ in verified]
+        if done:
+            await self.db.remove_challenges([(x.guild, x.discord_id) for x in done])
+        for x in expired:
+            await self.notify(self.on_expired, x)
+        for x, info in verified:
+            await self.notify(self.on_verified, x, info)
+        return len(live) > len(verified)
+
+    async def notify(self, callback, *args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            print(f"Error while finishing handle verification: {e}")
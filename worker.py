@@ -0,0 +1,40 @@
+# Runs the Codeforces polling, problemset refresh and POTD selection apart from the Discord gateway, so a slow sync
+# never holds up heartbeats or commands. Start the bot with worker_socket set and run this next to it:
+#
+#   worker_socket=/run/potd/worker.sock python main.py
+#   worker_socket=/run/potd/worker.sock python worker.py
+#
+# The gateway listens on the socket. The worker connects to it, posts through typed events (see events.py) and
+# takes "poll now" and "guild configured" events back. Either side can be restarted on its own.
+import asyncio
+import os
+
+import cf_api
+import database
+import events
+import main
+from metrics import metrics
+
+
+async def run(path, cf=None):
+    main.gateway_link = events.EventLink(main.handle_command)
+    main.db = database.AsyncDatabase(await asyncio.to_thread(database.Database))
+    main.cf = cf or cf_api.CodeforcesAPI()
+    if os.getenv("worker_metrics_port"):
+        await metrics.serve(os.getenv("metrics_host", "127.0.0.1"), int(os.getenv("worker_metrics_port")))
+    try:
+        await main.start_sync()
+        # commands queued by the gateway while the worker was down need the scheduler, so connect once it's up.
+        # Events emitted during start_sync wait in the link's backlog until then
+        print('Worker started')
+        await main.gateway_link.connect(path)
+    finally:
+        if main.solve_writer is not None:
+            await main.solve_writer.flush()
+        await metrics.close()
+        await main.cf.close()
+        main.db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(os.environ["worker_socket"]))